@@ -0,0 +1,229 @@
+# Async web app, serves the same API as main.py
+# Tokenization runs in a pool of worker processes so throughput scales with cores, and requests
+# over the queue limit or past their deadline are rejected instead of slowing everyone down
+
+import asyncio, json, os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import mysql.connector, nltk
+try:
+    from aiohttp import web
+except:
+    print("This script requires the \"aiohttp\" package!")
+    exit()
+import lib
+
+WORKERS = int(os.environ.get("WORKERS", os.cpu_count())) # Tokenizer processes
+MAX_PENDING = int(os.environ.get("MAX_PENDING", 8 * WORKERS)) # Requests in progress before new ones are rejected
+DEADLINE = float(os.environ.get("DEADLINE", 2.0)) # Seconds a request may take before it is abandoned
+PRIORS_REFRESH_INTERVAL = 60 # Seconds between counting newly downloaded tweets
+TRENDING_WEIGHT = float(os.environ.get("TRENDING_WEIGHT", 0)) # Default boost of trending hashtags, 0 so rankings only change when asked for with ?trending=
+DIVERSIFY_OVERSAMPLE = 3 # Candidates fetched per returned hashtag when near-synonyms are removed
+DIVERSIFY_THRESHOLD = 0.5 # Co-occurrence similarity from which two hashtags count as near-synonyms
+QUANTIZE = os.environ.get("QUANTIZE") # "uint8" or "float16" to serve a quantized model (see compare_quantization.py)
+PORT = int(os.environ.get("PORT", 8080))
+DEFAULT_MODEL_ID = int(os.environ.get("MODEL_ID", 1)) # Served when a request has no model parameter
+MODEL_MEMORY_BUDGET = int(os.environ.get("MODEL_MEMORY_BUDGET", 4096)) * 1024 * 1024 # MiB for all loaded models
+SESSION_MEMORY_BUDGET = int(os.environ.get("SESSION_MEMORY_BUDGET", 256)) * 1024 * 1024 # MiB for the running scores of as-you-type sessions
+LOAD_WORKERS = int(os.environ.get("LOAD_WORKERS", 1)) # Threads loading models, kept apart from scoring so cold loads can't take every scoring thread
+
+nltk.download("wordnet")
+nltk.download("averaged_perceptron_tagger")
+
+def connect():
+    # Will change later so it's fine for it to be in repo
+    # Connections aren't thread-safe, every thread using the database opens its own
+    return mysql.connector.connect(
+        host="db",
+        user="TweetHashtagAssigner",
+        password="password",
+        database="TweetHashtagAssigner",
+        use_pure=True
+    )
+
+def load_model(model_id):
+    database = connect()
+    try:
+        cursor = database.cursor()
+        cursor.execute("SELECT id FROM models WHERE id=%s", (model_id,))
+        exists = bool(cursor.fetchall())
+        cursor.close()
+        if not exists:
+            raise KeyError(model_id)
+        model = lib.Model.load(database, 10, model_id)
+        if QUANTIZE:
+            model = lib.QuantizedModel.from_model(model, QUANTIZE)
+        model.priors = lib.HashtagPriors.build(database, model)
+        model.hashtag_index = lib.HashtagIndex(model.hashtags, model.hashtag_frequencies)
+        return model
+    finally:
+        database.disconnect()
+
+models = lib.ModelRegistry(load_model, MODEL_MEMORY_BUDGET)
+models.get(DEFAULT_MODEL_ID)
+sessions = lib.ScoringSessions(SESSION_MEMORY_BUDGET)
+
+# Created before the event loop so the workers are forked from a plain process, the model stays shared with the parent
+tokenizer_pool = ProcessPoolExecutor(max_workers=WORKERS, initializer=lib.warm_tokenizer)
+scoring_pool = ThreadPoolExecutor(max_workers=WORKERS) # numpy releases the GIL while summing
+loading_pool = ThreadPoolExecutor(max_workers=LOAD_WORKERS)
+pending = 0
+
+def score(model, word_ids, trending_weight, diversify, session_id=None):
+    if session_id:
+        prob = sessions.update(session_id, model, word_ids)
+        if not word_ids:
+            return []
+    else:
+        prob = model.word_ids_probability(word_ids)
+    prob = model.trending_boost(prob, trending_weight)
+    if diversify:
+        hashtag_ids = model.cooccurrence.diversify(lib.top_k(prob, 10 * DIVERSIFY_OVERSAMPLE), 10, DIVERSIFY_THRESHOLD)
+    else:
+        hashtag_ids = lib.top_k(prob, 10)
+    return [ model.get_hashtag_string(hashtag_id) for hashtag_id in hashtag_ids ]
+
+async def get_model(request, deadline=None):
+    """Get the model of the request's model parameter, loading it in the loading pool if it isn't loaded
+    A load past the deadline (DEADLINE from now by default) is left to finish in the background and the request times out"""
+    try:
+        model_id = int(request.query.get("model", DEFAULT_MODEL_ID))
+    except ValueError:
+        raise web.HTTPBadRequest()
+    if model_id in models:
+        return models.get(model_id)
+    loop = asyncio.get_running_loop()
+    if deadline == None:
+        deadline = loop.time() + DEADLINE
+    try:
+        return await asyncio.wait_for(
+            asyncio.shield(loop.run_in_executor(loading_pool, models.get, model_id)),
+            deadline - loop.time()
+        )
+    except KeyError:
+        raise web.HTTPNotFound()
+    except asyncio.TimeoutError:
+        raise web.HTTPGatewayTimeout()
+
+async def probability(request):
+    global pending
+    text = request.query.get("text")
+    # With a session ID only the words that changed since the session's last text are scored (as-you-type suggestions)
+    session_id = None
+    if request.path == "/api/session":
+        session_id = request.query.get("id")
+        if not session_id:
+            raise web.HTTPNotFound()
+        text = text or ""
+    elif not text:
+        raise web.HTTPNotFound()
+    try:
+        trending_weight = float(request.query.get("trending", TRENDING_WEIGHT))
+        diversify = bool(int(request.query.get("diversify", 0)))
+    except ValueError:
+        raise web.HTTPBadRequest()
+    if pending >= MAX_PENDING:
+        raise web.HTTPServiceUnavailable(headers={"Retry-After": "1"})
+
+    pending += 1
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + DEADLINE
+    try:
+        model = await get_model(request, deadline)
+        diversify = diversify and model.cooccurrence != None
+        words, _ = await asyncio.wait_for(
+            loop.run_in_executor(tokenizer_pool, lib.tokenize_tweet, text.lower()),
+            deadline - loop.time()
+        )
+        hashtags = await asyncio.wait_for(
+            loop.run_in_executor(scoring_pool, score, model, model.get_word_ids(words), trending_weight, diversify, session_id),
+            deadline - loop.time()
+        )
+    except asyncio.TimeoutError:
+        raise web.HTTPGatewayTimeout()
+    finally:
+        pending -= 1
+    return web.Response(text=json.dumps({
+        "hashtags": hashtags
+    }), content_type="application/json")
+
+async def hashtags(request):
+    prefix = request.query.get("prefix")
+    if prefix == None:
+        raise web.HTTPNotFound()
+    model = await get_model(request)
+    try:
+        limit = int(request.query.get("limit", model.hashtag_index.top_count))
+    except ValueError:
+        raise web.HTTPBadRequest()
+    return web.Response(text=json.dumps({
+        "hashtags": [ model.get_hashtag_string(hashtag_id) for hashtag_id in model.hashtag_index.complete(prefix, limit) ]
+    }), content_type="application/json")
+
+async def related(request):
+    hashtag = request.query.get("hashtag")
+    if not hashtag:
+        raise web.HTTPNotFound()
+    model = await get_model(request)
+    if model.cooccurrence == None:
+        raise web.HTTPNotFound()
+    try:
+        hashtag_id = model.get_hashtag_id(hashtag.lstrip("#"))
+    except KeyError:
+        raise web.HTTPNotFound()
+    try:
+        limit = int(request.query.get("limit", 10))
+    except ValueError:
+        raise web.HTTPBadRequest()
+    return web.Response(text=json.dumps({
+        "hashtags": [ model.get_hashtag_string(related_id) for related_id in model.cooccurrence.related(hashtag_id, limit) ]
+    }), content_type="application/json")
+
+async def refresh_priors(app):
+    loop = asyncio.get_running_loop()
+    # Refreshes run one at a time, so they share one connection of their own
+    database = None
+    try:
+        while True:
+            await asyncio.sleep(PRIORS_REFRESH_INTERVAL)
+            sessions.expire() # Idle sessions are dropped even without new traffic
+            try:
+                database = database or await loop.run_in_executor(loading_pool, connect)
+                for model in models.models():
+                    await loop.run_in_executor(loading_pool, model.priors.refresh, database, model)
+            except mysql.connector.Error as error:
+                print(f"Refreshing priors failed: {error}")
+                database = None # Reconnect on the next refresh
+    finally:
+        if database:
+            database.disconnect()
+
+async def loaded_models(request):
+    return web.Response(text=json.dumps({
+        "memory_budget": models.memory_budget,
+        "nbytes": models.nbytes,
+        "models": models.stats()
+    }), content_type="application/json")
+
+async def start_background_tasks(app):
+    app["refresh_priors"] = asyncio.create_task(refresh_priors(app))
+
+async def stop_background_tasks(app):
+    app["refresh_priors"].cancel()
+    tokenizer_pool.shutdown(cancel_futures=True)
+    scoring_pool.shutdown(cancel_futures=True)
+    loading_pool.shutdown(cancel_futures=True)
+
+app = web.Application()
+app.router.add_get("/api/probability", probability)
+app.router.add_get("/api/session", probability)
+app.router.add_get("/api/hashtags", hashtags)
+app.router.add_get("/api/related", related)
+app.router.add_get("/api/models", loaded_models)
+app.on_startup.append(start_background_tasks)
+app.on_cleanup.append(stop_background_tasks)
+
+if __name__ == "__main__":
+    # Start every worker now so the first requests don't pay for loading NLTK
+    for future in [ tokenizer_pool.submit(lib.warm_tokenizer) for _ in range(WORKERS) ]:
+        future.result()
+    web.run_app(app, port=PORT)
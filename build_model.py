@@ -0,0 +1,50 @@
+# Builds a model from the tweets table and saves it to the database
+
+import argparse, time
+import mysql.connector
+import lib
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--address","-a",help="Hostname of the database",default="db")
+parser.add_argument("--database","-d",help="Name of database to use",default="TweetHashtagAssigner")
+parser.add_argument("--user","-u",help="Database user to login with",default="TweetHashtagAssigner")
+parser.add_argument("--password","-p",help="Database password for user",required=True)
+parser.add_argument("--model_id","-m",help="Model ID to save to (overwritten if it exists), a new ID is used if not given",type=int,default=None)
+parser.add_argument("--batch_size","-b",help="Batch size for saving relations",type=int,default=10)
+parser.add_argument("--out_of_core","-o",help="Directory for an out-of-core build (resumed if it already has a checkpoint)",default=None)
+parser.add_argument("--memory_budget","-mb",help="Memory budget in MiB for counting relations in an out-of-core build",type=int,default=1024)
+parser.add_argument("--codec","-c",help="Encoding of the saved relations rows (dense, none, zlib or lzma)",choices=["dense","none","zlib","lzma"],default="zlib")
+parser.add_argument("--logging","-l",help="Log actions",action="store_true")
+args = parser.parse_args()
+
+if __name__ == "__main__":
+    database = mysql.connector.connect(
+        host=args.address,
+        user=args.user,
+        password=args.password,
+        database=args.database
+    )
+
+    start = time.time()
+    if args.out_of_core:
+        builder = lib.ShardedBuilder(
+            args.out_of_core,
+            memory_budget=args.memory_budget * 1024 * 1024,
+            logging=args.logging
+        )
+        # The build streams tweets from a second connection while the first is free for saving
+        tweets_database = mysql.connector.connect(
+            host=args.address,
+            user=args.user,
+            password=args.password,
+            database=args.database
+        )
+        model = builder.build(lib.iterate_tweets(tweets_database))
+        tweets_database.disconnect()
+    else:
+        model = lib.Model.build(lib.load_tweets(database), logging=args.logging)
+    model_id = model.save(database, args.batch_size, args.model_id, args.codec)
+    database.disconnect()
+
+    print("Model ID:",model_id)
+    print("Total time (s):",time.time()-start)
@@ -0,0 +1,38 @@
+# Compares the rankings and speed of a quantized model against the exact model
+
+import argparse
+import mysql.connector
+import lib
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--address","-a",help="Hostname of the database",default="db")
+parser.add_argument("--database","-d",help="Name of database to use",default="TweetHashtagAssigner")
+parser.add_argument("--user","-u",help="Database user to login with",default="TweetHashtagAssigner")
+parser.add_argument("--password","-p",help="Database password for user",required=True)
+parser.add_argument("--model_id","-m",help="ID of the model to compare",type=int,default=1)
+parser.add_argument("--texts","-n",help="Number of (most recent) tweets to score",type=int,default=1000)
+parser.add_argument("--top","-k",help="Number of top hashtags to compare",type=int,default=10)
+args = parser.parse_args()
+
+if __name__ == "__main__":
+    database = mysql.connector.connect(
+        host=args.address,
+        user=args.user,
+        password=args.password,
+        database=args.database,
+        use_pure=True
+    )
+    model = lib.Model.load(database, 10, args.model_id)
+    cursor = database.cursor()
+    cursor.execute("SELECT content FROM tweets ORDER BY id DESC LIMIT %s", (args.texts,))
+    texts = [ tweet[0] for tweet in cursor.fetchall() ]
+    cursor.close()
+    database.disconnect()
+
+    print("Exact relations (MiB):",model.relations.nbytes/2**20)
+    for dtype in ("uint8", "float16"):
+        quantized = lib.QuantizedModel.from_model(model, dtype)
+        print(f"\n{dtype} scores (MiB):",quantized.scores.nbytes/2**20)
+        print("Non-zero counts quantized to 0:",f"{quantized.zeroed_cells} of {quantized.nonzero_cells}")
+        for name, value in lib.compare_models(model, quantized, texts, args.top).items():
+            print(f"{name}:",value)
@@ -0,0 +1,41 @@
+# Removes near-duplicate tweets (retweets, copy-paste spam) from the tweets table
+
+import argparse, time
+import mysql.connector
+from lib.Deduplicator import Deduplicator, deduplicate_tweets
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--address","-a",help="Hostname of the database",default="db")
+parser.add_argument("--database","-d",help="Name of database to use",default="TweetHashtagAssigner")
+parser.add_argument("--user","-u",help="Database user to login with",default="TweetHashtagAssigner")
+parser.add_argument("--password","-p",help="Database password for user",required=True)
+parser.add_argument("--threshold","-t",help="Estimated similarity above which a tweet is a near-duplicate",type=float,default=0.8)
+parser.add_argument("--window","-w",help="Number of recent tweets remembered for deduplication (about 900 bytes each)",type=int,default=100000)
+parser.add_argument("--batch_size","-b",help="Batch size for fetching and deleting tweets",type=int,default=10000)
+parser.add_argument("--dry_run","-n",help="Only count duplicates, do not delete them",action="store_true")
+parser.add_argument("--logging","-l",help="Log actions",action="store_true")
+args = parser.parse_args()
+
+if __name__ == "__main__":
+    database = mysql.connector.connect(
+        host=args.address,
+        user=args.user,
+        password=args.password,
+        database=args.database
+    )
+
+    deduplicator = Deduplicator(threshold=args.threshold, window=args.window)
+    start = time.time()
+    duplicate_ids = deduplicate_tweets(
+        database,
+        deduplicator,
+        args.batch_size,
+        delete=not args.dry_run,
+        logging=args.logging
+    )
+    end = time.time()
+    database.disconnect()
+
+    print("Tweets checked:",deduplicator.checked)
+    print("Duplicates " + ("found:" if args.dry_run else "removed:"),len(duplicate_ids))
+    print("Total time (s):",end-start)
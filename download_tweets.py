@@ -11,6 +11,8 @@ try:
 except:
     print("This script requires the \"mysql-connector-python\" package!")
     exit()
+from lib.Deduplicator import Deduplicator
+from lib.ingest import extract_tweet
 
 tweet_count = 0
 
@@ -27,30 +29,31 @@ class Counter:
         self.value += value
 
 class StreamListener(tweepy.StreamListener):
-    def __init__(self, cursor, logging):
+    def __init__(self, cursor, logging, deduplicator=None):
         super().__init__()
         self.count = 0
+        self.retweets = 0
         self.cursor = cursor
         self.logging = logging
+        self.deduplicator = deduplicator
 
     def on_status(self, status):
-        text = status.text
-        entities = status.entities
-
-        if status.truncated:
-            text = status.extended_tweet["full_text"]
-            entities = status.extended_tweet["entities"]
-        
-        if len(entities["hashtags"]) > 0:
+        # Retweets are collapsed into the original tweet so they share its ID (same logic as replaying archives)
+        tweet = extract_tweet(status._json)
+        if tweet == None:
+            return
+        tweet_id, text, hashtags, retweet = tweet
+        self.retweets += retweet
+
+        if len(hashtags) > 0:
+            if self.deduplicator and self.deduplicator.is_duplicate(text):
+                return
             self.count += 1
             save(
                 self.cursor,
-                status.id,
+                tweet_id,
                 text,
-                [
-                    hashtag["text"]
-                    for hashtag in entities["hashtags"]
-                ]
+                hashtags
             )
             if self.logging:
                 sys.stdout.write("\r")
@@ -70,6 +73,8 @@ parser.add_argument("--secret","-s",help="Consumer API Secret",required=True)
 parser.add_argument("--token","-t",help="User API token",required=True)
 parser.add_argument("--token_secret","-ts",help="User API token secret",required=True)
 parser.add_argument("--logging","-l",help="Log actions",action="store_true")
+parser.add_argument("--dedup_threshold","-dt",help="Estimated similarity above which a tweet is dropped as a near-duplicate (0 disables deduplication)",type=float,default=0.8)
+parser.add_argument("--dedup_window","-dw",help="Number of recent tweets remembered for deduplication",type=int,default=100000)
 args = parser.parse_args()
 
 
@@ -91,7 +96,8 @@ if __name__ == "__main__":
 
     counter = Counter()
     cursor = database.cursor()
-    streamListener = StreamListener(cursor,logging=args.logging)
+    deduplicator = Deduplicator(threshold=args.dedup_threshold, window=args.dedup_window) if args.dedup_threshold > 0 else None
+    streamListener = StreamListener(cursor,logging=args.logging,deduplicator=deduplicator)
     start = time.time()
 
     try:
@@ -112,3 +118,6 @@ if __name__ == "__main__":
     if args.logging:
         print("Total time (s):",end-start)
         print("Valid tweets per second:",streamListener.count/(end-start))
+        print("Retweets collapsed:",streamListener.retweets)
+        if deduplicator:
+            print("Near-duplicates dropped:",deduplicator.duplicates)
@@ -0,0 +1,41 @@
+# Builds a model on a deterministic train split of the tweets table and evaluates it on the rest
+
+import argparse, time
+import mysql.connector
+import lib
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--address","-a",help="Hostname of the database",default="db")
+parser.add_argument("--database","-d",help="Name of database to use",default="TweetHashtagAssigner")
+parser.add_argument("--user","-u",help="Database user to login with",default="TweetHashtagAssigner")
+parser.add_argument("--password","-p",help="Database password for user",required=True)
+parser.add_argument("--test_fraction","-t",help="Fraction of tweets held out for testing",type=float,default=0.1)
+parser.add_argument("--seed","-s",help="Seed of the train/test split",type=int,default=0)
+parser.add_argument("--top","-k",help="Number of predicted hashtags per tweet",type=int,default=10)
+parser.add_argument("--batch_size","-b",help="Number of test tweets scored at a time",type=int,default=256)
+parser.add_argument("--workers","-w",help="Number of processes for tokenizing test tweets",type=int,default=None)
+parser.add_argument("--logging","-l",help="Log actions",action="store_true")
+args = parser.parse_args()
+
+if __name__ == "__main__":
+    database = mysql.connector.connect(
+        host=args.address,
+        user=args.user,
+        password=args.password,
+        database=args.database
+    )
+
+    timings = {}
+    start = time.perf_counter()
+    train, test = lib.split_tweets(lib.load_tweets(database, with_ids=True), args.test_fraction, args.seed)
+    database.disconnect()
+    timings["split_seconds"] = time.perf_counter() - start
+    if args.logging: print(f"{len(train)} train tweets, {len(test)} test tweets")
+
+    start = time.perf_counter()
+    model = lib.Model.build(train, logging=args.logging)
+    timings["build_seconds"] = time.perf_counter() - start
+
+    results = lib.evaluate(model, test, args.top, args.batch_size, workers=args.workers, logging=args.logging)
+    for name, value in { **timings, **results }.items():
+        print(f"{name}:",value)
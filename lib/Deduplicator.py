@@ -0,0 +1,315 @@
+from __future__ import annotations
+from typing import List, Dict, Tuple
+import hashlib, mysql.connector, numpy, re, sys, zlib
+
+_PRIME = (1 << 31) - 1 # Hashes are reduced mod this so a * hash + b always fits in an uint64
+
+_RETWEET_REGEX = re.compile(r"^rt\s+@\w+:?\s*")
+_URL_REGEX = re.compile(r"https?://\S+")
+_MENTION_REGEX = re.compile(r"@\w+")
+_TOKEN_REGEX = re.compile(r"\w+")
+
+def _tokenize(text: str) -> List[str]:
+    # Retweet prefixes, links and mentions are removed first since they are what usually differs between copies
+    text = _RETWEET_REGEX.sub("", text.lower())
+    text = _URL_REGEX.sub(" ", text)
+    text = _MENTION_REGEX.sub(" ", text)
+    return _TOKEN_REGEX.findall(text)
+
+def shingle_text(text: str, shingle_size: int = 3) -> List[str]:
+    """Split a tweet into word shingles for near-duplicate detection
+    Retweet prefixes, links and mentions are removed first since they are what usually differs between copies
+
+    Args:
+        text (str): The text of the tweet
+        shingle_size (int, optional): The number of words per shingle. Defaults to 3.
+
+    Returns:
+        List[str]: The list of shingles (empty if the tweet has no words)
+    """
+    tokens = _tokenize(text)
+    if len(tokens) < shingle_size:
+        return [" ".join(tokens)] if tokens else []
+    return [
+        " ".join(tokens[index:index+shingle_size])
+        for index in range(len(tokens)-shingle_size+1)
+    ]
+
+class MinHasher:
+    def __init__(self, permutations: int = 64, shingle_size: int = 3, seed: int = 1):
+        self.permutations = permutations
+        self.shingle_size = shingle_size
+
+        # Same seed gives the same permutations, so signatures are comparable between runs
+        generator = numpy.random.RandomState(seed)
+        self._a = generator.randint(1, _PRIME, size=permutations, dtype=numpy.uint64)
+        self._b = generator.randint(0, _PRIME, size=permutations, dtype=numpy.uint64)
+
+    def signature(self, text: str) -> numpy.ndarray:
+        """Calculate the MinHash signature of a tweet
+
+        Args:
+            text (str): The text of the tweet
+
+        Returns:
+            numpy.ndarray: A numpy array with shape (permutations,) or None if the tweet has no words
+        """
+        return self.shingles_signature(shingle_text(text, self.shingle_size))
+
+    def shingles_signature(self, shingles: List[str]) -> numpy.ndarray:
+        """Calculate the MinHash signature of a set of shingles
+
+        Args:
+            shingles (List[str]): The shingles, see shingle_text
+
+        Returns:
+            numpy.ndarray: A numpy array with shape (permutations,) or None if there are no shingles
+        """
+        shingles = set(shingles)
+        if not shingles:
+            return None
+        # crc32 is used instead of hash() because hash() is salted per process
+        hashes = numpy.array(
+            [ zlib.crc32(shingle.encode()) for shingle in shingles ],
+            dtype=numpy.uint64
+        ) % _PRIME
+        permuted = (numpy.outer(hashes, self._a) + self._b) % _PRIME
+        return permuted.min(axis=0).astype(numpy.uint32)
+
+class Deduplicator:
+    def __init__(self,
+        threshold: float = 0.8,
+        permutations: int = 64,
+        bands: int = 16,
+        window: int = 100000,
+        shingle_size: int = 3,
+        seed: int = 1):
+        """Near-duplicate detector over a sliding window of recently seen tweets (MinHash LSH)
+        Memory is allocated up front in flat arrays, about (4 * permutations + 48 * bands) bytes per remembered tweet.
+        Tweets with fewer words than shingle_size only match exact copies (after normalisation), a single
+        shingle would make every short tweet with the same words a near-duplicate of the others.
+
+        Args:
+            threshold (float, optional): Estimated similarity above which a tweet is a near-duplicate. Defaults to 0.8.
+            permutations (int, optional): The MinHash signature length. Defaults to 64.
+            bands (int, optional): The number of LSH bands (must divide permutations). Defaults to 16.
+            window (int, optional): The number of recent (non-duplicate) tweets remembered. Defaults to 100000.
+            shingle_size (int, optional): The number of words per shingle. Defaults to 3.
+            seed (int, optional): The seed of the MinHash permutations. Defaults to 1.
+        """
+        if permutations % bands != 0:
+            raise ValueError(f"Permutations ({permutations}) must be divisible by bands ({bands})")
+        self.hasher = MinHasher(permutations=permutations, shingle_size=shingle_size, seed=seed)
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = permutations // bands
+        self.window = window
+
+        # Ring buffer of the remembered tweets, entry ID % window is the slot of an entry
+        self._ids = numpy.full(window, -1, dtype=numpy.int64) # Entry ID in each slot, an entry is evicted once its slot is reused
+        self._signatures = numpy.zeros((window, permutations), dtype=numpy.uint32)
+        self._band_keys = numpy.zeros((window, bands), dtype=numpy.uint64)
+        self._previous = numpy.full((window, bands), -1, dtype=numpy.int64) # Previous entry ID with the same band key
+        self._exact_keys = numpy.zeros(window, dtype=numpy.uint64) # Hash of short tweets (0 for others)
+        # Open addressing table per band from a band key to the latest entry ID with it,
+        # entries of evicted tweets are reused by later inserts
+        self._table_size = 1 << max(1, (2 * window - 1).bit_length())
+        self._table = numpy.full((bands, self._table_size), -1, dtype=numpy.int64)
+        self._table_used = [0] * bands
+        self._exact = {} # Short tweet hash -> latest entry ID
+        self._next_id = 0
+
+        multipliers = numpy.random.RandomState(seed).randint(1, 1 << 62, size=self.rows, dtype=numpy.uint64) | numpy.uint64(1)
+        self._multipliers = multipliers
+
+        self.checked = 0
+        self.duplicates = 0
+
+    def _live(self, entry_id: int) -> bool:
+        return entry_id >= 0 and self._ids[entry_id % self.window] == entry_id
+
+    def _probe(self, band: int, key: int) -> Tuple[int, int]:
+        """Find the table position of a band key
+
+        Returns:
+            Tuple[int, int]: The position and the latest live entry ID with the key, or the position to insert it at and -1
+        """
+        table = self._table[band]
+        mask = self._table_size - 1
+        position = key & mask
+        free = -1
+        while True:
+            entry_id = int(table[position])
+            if entry_id == -1:
+                return (position if free == -1 else free), -1
+            if self._live(entry_id):
+                if int(self._band_keys[entry_id % self.window, band]) == key:
+                    return position, entry_id
+            elif free == -1:
+                free = position
+            position = (position + 1) & mask
+
+    def _rebuild_table(self, band: int):
+        # Too few empty positions left, probing would get long, so only the latest live entry of every key is put back
+        table = self._table[band]
+        table[:] = -1
+        self._table_used[band] = 0
+        live = numpy.sort(self._ids[self._ids >= 0])
+        keys = self._band_keys[live % self.window, band].tolist()
+        exact = self._exact_keys[live % self.window]
+        for entry_id, key, short in zip(live.tolist(), keys, (exact != 0).tolist()):
+            if short:
+                continue
+            position, _ = self._probe(band, key)
+            if table[position] == -1:
+                self._table_used[band] += 1
+            table[position] = entry_id
+
+    def _keys(self, signature: numpy.ndarray) -> List[int]:
+        # Products wrap around modulo 2^64, which is what is wanted for a hash
+        return (signature.reshape(self.bands, self.rows).astype(numpy.uint64) * self._multipliers).sum(axis=1).tolist()
+
+    def _find_duplicate(self, signature: numpy.ndarray, keys: List[int], probes: List[Tuple[int, int]]) -> bool:
+        candidates = set()
+        for band, key in enumerate(keys):
+            position, entry_id = self._probe(band, key)
+            probes.append((position, entry_id))
+            # Entries already collected from an earlier band are skipped, older ones in the chain may match only this band
+            while entry_id != -1 and self._live(entry_id):
+                candidates.add(entry_id)
+                entry_id = int(self._previous[entry_id % self.window, band])
+        if not candidates:
+            return False
+        slots = numpy.array(list(candidates), dtype=numpy.int64) % self.window
+        similarities = numpy.count_nonzero(self._signatures[slots] == signature, axis=1) / len(signature)
+        return bool((similarities >= self.threshold).any())
+
+    def _insert(self, signature: numpy.ndarray = None, keys: List[int] = None, probes: List[Tuple[int, int]] = None, exact_key: int = 0):
+        entry_id = self._next_id
+        self._next_id += 1
+        slot = entry_id % self.window
+
+        # Evict the tweet in the slot
+        evicted_key = int(self._exact_keys[slot])
+        if evicted_key and self._exact.get(evicted_key) == int(self._ids[slot]):
+            del self._exact[evicted_key]
+        self._ids[slot] = entry_id
+        self._exact_keys[slot] = exact_key
+
+        if exact_key:
+            self._exact[exact_key] = entry_id
+            return
+        self._signatures[slot] = signature
+        self._band_keys[slot] = keys
+        # The probes of the duplicate check are still valid, nothing changed since
+        for band, (position, previous) in enumerate(probes):
+            self._previous[slot, band] = previous
+            if self._table[band, position] == -1:
+                self._table_used[band] += 1
+            self._table[band, position] = entry_id
+            if 4 * self._table_used[band] > 3 * self._table_size:
+                self._rebuild_table(band)
+
+    def is_duplicate(self, text: str) -> bool:
+        """Check whether a tweet is a near-duplicate of a recently seen tweet
+        Tweets which are not duplicates are remembered (up to window tweets)
+
+        Args:
+            text (str): The text of the tweet
+
+        Returns:
+            bool: Whether the tweet is a near-duplicate
+        """
+        self.checked += 1
+        tokens = _tokenize(text)
+        if not tokens:
+            return False
+        if len(tokens) < self.hasher.shingle_size:
+            # Never 0, which marks tweets that aren't short
+            exact_key = int.from_bytes(hashlib.blake2b(" ".join(tokens).encode(), digest_size=8).digest(), "little") or 1
+            if self._live(self._exact.get(exact_key, -1)):
+                self.duplicates += 1
+                return True
+            self._insert(exact_key=exact_key)
+            return False
+
+        signature = self.hasher.shingles_signature(
+            [ " ".join(tokens[index:index+self.hasher.shingle_size]) for index in range(len(tokens)-self.hasher.shingle_size+1) ]
+        )
+        keys = self._keys(signature)
+        probes = []
+        if self._find_duplicate(signature, keys, probes):
+            self.duplicates += 1
+            return True
+        self._insert(signature, keys, probes)
+        return False
+
+    @property
+    def nbytes(self) -> int:
+        """Get the memory used by the remembered tweets
+
+        Returns:
+            int: The size in bytes
+        """
+        return (
+            self._ids.nbytes + self._signatures.nbytes + self._band_keys.nbytes + self._previous.nbytes
+            + self._exact_keys.nbytes + self._table.nbytes + sys.getsizeof(self._exact) + 64 * len(self._exact)
+        )
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Get the deduplication counters
+
+        Returns:
+            Dict[str, int]: The checked, duplicate and remembered tweet counts
+        """
+        return {
+            "checked": self.checked,
+            "duplicates": self.duplicates,
+            "remembered": min(self._next_id, self.window)
+        }
+
+def deduplicate_tweets(
+    database: mysql.connector.MySQLConnection,
+    deduplicator: Deduplicator,
+    batch_size: int,
+    delete: bool = True,
+    logging: bool = True) -> List[int]:
+    """Remove near-duplicate tweets from the tweets table
+    Tweets are scanned in ID order so the oldest copy is the one that is kept
+
+    Args:
+        database (mysql.connector.MySQLConnection): The MySQL database connection to use
+        deduplicator (Deduplicator): The deduplicator to use
+        batch_size (int): Batch size for fetching and deleting tweets
+        delete (bool, optional): Whether to delete the duplicates or only find them. Defaults to True.
+        logging (bool, optional): Whether to log progress in stdout or not. Defaults to True.
+
+    Returns:
+        List[int]: The IDs of the duplicate tweets
+    """
+    cursor = database.cursor()
+    cursor.execute("SELECT id, content FROM tweets ORDER BY id ASC")
+    duplicate_ids = []
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        for tweet_id, content in rows:
+            if deduplicator.is_duplicate(content):
+                duplicate_ids.append(tweet_id)
+        if logging: print(f"{deduplicator.checked} tweets checked, {deduplicator.duplicates} duplicates found")
+
+    # The select has to be fully read before the same connection can delete
+    if delete:
+        for index in range(0, len(duplicate_ids), batch_size):
+            batch = duplicate_ids[index:index+batch_size]
+            cursor.execute(
+                f"DELETE FROM tweets WHERE id IN ({', '.join(['%s'] * len(batch))})",
+                tuple(batch)
+            )
+        database.commit()
+        if logging: print(f"{len(duplicate_ids)} duplicate tweets deleted")
+
+    cursor.close()
+    return duplicate_ids
@@ -0,0 +1,166 @@
+from __future__ import annotations
+from typing import List, Dict, Tuple
+from concurrent.futures import ProcessPoolExecutor
+import numpy, time, zlib
+
+from .Model import Model
+from .LargeCounts import LargeCounts
+from .utils import tokenize_tweet
+
+def split_tweets(tweets: List[Tuple[int,str,str]], test_fraction: float = 0.1, seed: int = 0) -> Tuple[List[Tuple[str,str]], List[Tuple[str,str]]]:
+    """Deterministically split tweets into a train and a test set
+    A tweet's side only depends on its ID and the seed, so it stays the same as the table grows
+
+    Args:
+        tweets (List[Tuple[int,str,str]]): The tweets (id, content, hashtags), see .utils.load_tweets
+        test_fraction (float, optional): The fraction of tweets to put in the test set. Defaults to 0.1.
+        seed (int, optional): Changes which tweets end up in the test set. Defaults to 0.
+
+    Returns:
+        Tuple[List[Tuple[str,str]], List[Tuple[str,str]]]: The (train, test) tweets as (content, hashtags)
+    """
+    train = []
+    test = []
+    threshold = int(test_fraction * 10000)
+    for tweet_id, content, hashtags in tweets:
+        if zlib.crc32(f"{seed}:{tweet_id}".encode()) % 10000 < threshold:
+            test.append((content, hashtags))
+        else:
+            train.append((content, hashtags))
+    return train, test
+
+def _score_batch(
+    relations: numpy.ndarray,
+    large_counts: LargeCounts,
+    word_ids: List[List[int]],
+    targets: List[List[int]],
+    k: int,
+    memory_budget: int) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """Score a batch of tweets against every hashtag
+
+    Returns:
+        Tuple[numpy.ndarray, numpy.ndarray]: The top k hashtag IDs of each tweet (shape is (batch, k)) and
+            the number of other hashtags scoring at least as high as the best target hashtag of each tweet (shape is (batch,)),
+            ties rank before the target so they never inflate the rank
+    """
+    batch = len(word_ids)
+    hashtag_count = len(relations)
+    k = min(k, hashtag_count)
+
+    # Bag of words of the batch over only the words that appear in it
+    lengths = [ len(tweet_word_ids) for tweet_word_ids in word_ids ]
+    unique_words, columns = numpy.unique(
+        numpy.array([ word_id for tweet_word_ids in word_ids for word_id in tweet_word_ids ], dtype=numpy.int64),
+        return_inverse=True
+    )
+    bags = numpy.zeros((batch, len(unique_words)), dtype=numpy.float32)
+    numpy.add.at(bags, (numpy.repeat(numpy.arange(batch), lengths), columns), 1)
+
+    # Best score of a correct hashtag, every other hashtag scoring as much or above it ranks before it
+    best_target = numpy.full(batch, numpy.inf, dtype=numpy.float32)
+    for index, (tweet_word_ids, tweet_targets) in enumerate(zip(word_ids, targets)):
+        if tweet_targets and tweet_word_ids:
+            target_scores = relations[numpy.ix_(tweet_targets, tweet_word_ids)].sum(axis=1)
+            for target_index, hashtag_id in enumerate(tweet_targets):
+                large_counts.add_columns(target_scores[target_index:target_index+1], tweet_word_ids, (hashtag_id, hashtag_id + 1))
+            best_target[index] = target_scores.max()
+    higher = numpy.zeros(batch, dtype=numpy.int64)
+
+    top_scores = numpy.full((batch, 0), -numpy.inf, dtype=numpy.float32)
+    top_ids = numpy.zeros((batch, 0), dtype=numpy.int64)
+    block_size = max(1, memory_budget // (4 * (len(unique_words) + batch)))
+    for low in range(0, hashtag_count, block_size):
+        high = min(low + block_size, hashtag_count)
+        scores = bags @ relations[low:high][:,unique_words].astype(numpy.float32).T # (batch, block)
+        large_counts.add_bags(scores, bags, unique_words, (low, high))
+        higher += (scores >= best_target[:,None]).sum(axis=1)
+
+        # Merge the block into the running top k
+        top_scores = numpy.hstack((top_scores, scores))
+        top_ids = numpy.hstack((top_ids, numpy.broadcast_to(numpy.arange(low, high), (batch, high - low))))
+        if top_scores.shape[1] > k:
+            keep = numpy.argpartition(-top_scores, k - 1, axis=1)[:,:k]
+            top_scores = numpy.take_along_axis(top_scores, keep, axis=1)
+            top_ids = numpy.take_along_axis(top_ids, keep, axis=1)
+
+    order = numpy.argsort(-top_scores, axis=1, kind="stable")
+    # The best target ties with itself
+    return numpy.take_along_axis(top_ids, order, axis=1), numpy.maximum(higher - 1, 0)
+
+def evaluate(
+    model: Model,
+    tweets: List[Tuple[str,str]],
+    k: int = 10,
+    batch_size: int = 256,
+    memory_budget: int = 256 * 1024 * 1024,
+    workers: int = None,
+    logging: bool = True) -> Dict[str, float]:
+    """Measure how well a model predicts the hashtags of held-out tweets
+
+    Args:
+        model (Model): The model to evaluate
+        tweets (List[Tuple[str,str]]): The test tweets (content, hashtags)
+        k (int, optional): The number of predicted hashtags per tweet. Defaults to 10.
+        batch_size (int, optional): The number of tweets scored at a time. Defaults to 256.
+        memory_budget (int, optional): Rough memory in bytes for scoring a batch. Defaults to 256 MiB.
+        workers (int, optional): Number of processes for tokenizing, tokenizes in-process if None. Defaults to None.
+        logging (bool, optional): Whether to log progress in stdout or not. Defaults to True.
+
+    Returns:
+        Dict[str, float]: precision@k, recall@k, MRR (over the full ranking, ties ranked pessimistically), the number of
+            tweets with no known words (counted as misses), throughput in tweets/s and the time of each stage
+    """
+    results = { "tweets": len(tweets) }
+
+    start = time.perf_counter()
+    texts = [ tweet[0].lower() for tweet in tweets ]
+    if workers and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            tokenized = list(pool.map(tokenize_tweet, texts, chunksize=64))
+    else:
+        tokenized = [ tokenize_tweet(text) for text in texts ]
+    word_ids = [ model.get_word_ids(words) for words, _ in tokenized ]
+    target_counts = []
+    targets = []
+    for _, hashtags in tweets:
+        unique_hashtags = set(hashtags.split(","))
+        target_counts.append(len(unique_hashtags))
+        tweet_targets = []
+        for hashtag in unique_hashtags:
+            try:
+                tweet_targets.append(model.get_hashtag_id(hashtag))
+            except KeyError:
+                pass # Hashtags the model never saw can't be predicted, they still count against recall
+        targets.append(tweet_targets)
+    results["tokenize_seconds"] = time.perf_counter() - start
+    if logging: print("Test tweets tokenized")
+
+    start = time.perf_counter()
+    precision = 0
+    recall = 0
+    reciprocal_rank = 0
+    for low in range(0, len(tweets), batch_size):
+        high = min(low + batch_size, len(tweets))
+        top_ids, higher = _score_batch(model.relations, model.large_counts, word_ids[low:high], targets[low:high], k, memory_budget)
+        for index in range(high - low):
+            tweet_targets = targets[low + index]
+            if not tweet_targets or not word_ids[low + index]:
+                continue # Nothing to rank with, every hashtag scores 0, so it is a miss
+            hits = len(set(top_ids[index].tolist()) & set(tweet_targets))
+            precision += hits / k
+            recall += hits / target_counts[low + index]
+            reciprocal_rank += 1 / (int(higher[index]) + 1)
+        if logging: print(f"{high} test tweets scored")
+    results["score_seconds"] = time.perf_counter() - start
+
+    count = max(len(tweets), 1)
+    results[f"precision@{k}"] = precision / count
+    results[f"recall@{k}"] = recall / count
+    results["mrr"] = reciprocal_rank / count
+    results["no_word_tweets"] = sum(1 for tweet_word_ids in word_ids if not tweet_word_ids)
+    results["unknown_words_fraction"] = sum(1 for tweet_word_ids in word_ids if not tweet_word_ids) / count
+    results["unknown_hashtags_fraction"] = sum(1 for tweet_targets in targets if not tweet_targets) / count
+    results["score_tweets_per_second"] = len(tweets) / results["score_seconds"] if results["score_seconds"] else 0
+    total = results["tokenize_seconds"] + results["score_seconds"]
+    results["tweets_per_second"] = len(tweets) / total if total else 0
+    return results
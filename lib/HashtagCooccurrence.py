@@ -0,0 +1,244 @@
+from __future__ import annotations
+from typing import List, Tuple
+import mysql.connector, numpy
+
+from .encoding import encode_sparse_row, decode_sparse_row
+
+def _tweet_pairs(hashtags: numpy.ndarray, hashtag_counts: numpy.ndarray) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """Expand numerized tweets into every ordered pair of different hashtags in the same tweet
+
+    Args:
+        hashtags (numpy.ndarray): The hashtag IDs of all the tweets
+        hashtag_counts (numpy.ndarray): The number of hashtags in each tweet
+
+    Returns:
+        Tuple[numpy.ndarray, numpy.ndarray]: The (first, second) hashtag IDs of the pairs
+    """
+    hashtag_counts = numpy.asarray(hashtag_counts, dtype=numpy.int64)
+    hashtag_tweets = numpy.repeat(numpy.arange(len(hashtag_counts)), hashtag_counts)
+    starts = numpy.cumsum(hashtag_counts) - hashtag_counts
+    repeats = hashtag_counts[hashtag_tweets]
+    first = numpy.repeat(hashtags, repeats)
+    group_starts = numpy.repeat(numpy.cumsum(repeats) - repeats, repeats)
+    second = hashtags[numpy.repeat(starts[hashtag_tweets], repeats) + numpy.arange(len(first)) - group_starts]
+    different = first != second
+    return first[different], second[different]
+
+class HashtagCooccurrence:
+    def __init__(self,
+        indptr: numpy.ndarray,
+        indices: numpy.ndarray,
+        counts: numpy.ndarray,
+        hashtag_frequencies: numpy.ndarray,
+        top_n: int = 20):
+        """Sparse hashtag x hashtag co-occurrence counts with precomputed neighbor lists
+        Row i of the matrix is indices[indptr[i]:indptr[i+1]] with counts[indptr[i]:indptr[i+1]].
+        The top_n neighbors of every hashtag are ranked by Jaccard similarity
+        (tweets with both / tweets with either), so requests only read a fixed size row.
+
+        Args:
+            indptr (numpy.ndarray): The start of each row in indices and counts followed by the end of the last one (shape is (hashtag_count+1,))
+            indices (numpy.ndarray): The sorted hashtag IDs co-occurring with each hashtag
+            counts (numpy.ndarray): The number of tweets each pair was used together in
+            hashtag_frequencies (numpy.ndarray): The number of tweets each hashtag was used in
+            top_n (int, optional): The length of the neighbor lists. Defaults to 20.
+        """
+        if len(indptr) != len(hashtag_frequencies) + 1:
+            raise TypeError(f"Indptr shape ({len(indptr)}) must be one longer than hashtag frequencies shape ({len(hashtag_frequencies)})")
+        self.indptr = indptr
+        self.indices = indices
+        self.counts = counts
+        self.top_n = top_n
+
+        hashtag_count = len(hashtag_frequencies)
+        rows = numpy.repeat(numpy.arange(hashtag_count), numpy.diff(indptr))
+        frequencies = hashtag_frequencies.astype(numpy.float64)
+        union = frequencies[rows] + frequencies[indices] - counts
+        similarities = numpy.clip(counts / numpy.maximum(union, 1), 0, 1)
+
+        # Sort every row by similarity and keep the first top_n of each
+        order = numpy.lexsort((-similarities, rows))
+        ranks = numpy.arange(len(order)) - indptr[rows[order]]
+        keep = order[ranks < top_n]
+        self.neighbors = numpy.full((hashtag_count, top_n), -1, dtype=numpy.int32) # -1 pads rows with fewer neighbors
+        self.similarities = numpy.zeros((hashtag_count, top_n), dtype=numpy.float32)
+        self.neighbors[rows[keep], ranks[ranks < top_n]] = indices[keep]
+        self.similarities[rows[keep], ranks[ranks < top_n]] = similarities[keep]
+
+    @classmethod
+    def from_tweets(cls,
+        hashtags: numpy.ndarray,
+        hashtag_counts: numpy.ndarray,
+        hashtag_frequencies: numpy.ndarray,
+        top_n: int = 20,
+        chunk_size: int = 1000000) -> HashtagCooccurrence:
+        """Count the co-occurrences of numerized tweets
+
+        Args:
+            hashtags (numpy.ndarray): The hashtag IDs of all the tweets (can be a memmap)
+            hashtag_counts (numpy.ndarray): The number of hashtags in each tweet (can be a memmap)
+            hashtag_frequencies (numpy.ndarray): The number of tweets each hashtag was used in
+            top_n (int, optional): The length of the neighbor lists. Defaults to 20.
+            chunk_size (int, optional): The number of tweets expanded into pairs at a time. Defaults to 1000000.
+
+        Returns:
+            HashtagCooccurrence: The co-occurrences
+        """
+        hashtag_count = len(hashtag_frequencies)
+        codes = numpy.zeros(0, dtype=numpy.int64) # first * hashtag_count + second
+        counts = numpy.zeros(0, dtype=numpy.int64)
+        offset = 0
+        for low in range(0, len(hashtag_counts), chunk_size):
+            chunk_counts = numpy.asarray(hashtag_counts[low:low+chunk_size], dtype=numpy.int64)
+            total = int(chunk_counts.sum())
+            first, second = _tweet_pairs(numpy.asarray(hashtags[offset:offset+total], dtype=numpy.int64), chunk_counts)
+            offset += total
+            chunk_codes, chunk_code_counts = numpy.unique(first * hashtag_count + second, return_counts=True)
+            # Merge with the pairs of earlier chunks
+            codes, inverse = numpy.unique(numpy.concatenate((codes, chunk_codes)), return_inverse=True)
+            counts = numpy.bincount(inverse, weights=numpy.concatenate((counts, chunk_code_counts)), minlength=len(codes)).astype(numpy.int64)
+
+        rows = codes // hashtag_count
+        indptr = numpy.zeros(hashtag_count + 1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(rows, minlength=hashtag_count), out=indptr[1:])
+        return cls(indptr, (codes % hashtag_count).astype(numpy.int32), counts.astype(numpy.int32), hashtag_frequencies, top_n)
+
+    @property
+    def nbytes(self) -> int:
+        """Get the memory used by the counts and the neighbor lists
+
+        Returns:
+            int: The size in bytes
+        """
+        return self.indptr.nbytes + self.indices.nbytes + self.counts.nbytes + self.neighbors.nbytes + self.similarities.nbytes
+
+    def related(self, hashtag_id: int, limit: int = None) -> List[int]:
+        """Get the hashtags most often used together with a hashtag
+
+        Args:
+            hashtag_id (int): The hashtag ID
+            limit (int, optional): The number of hashtags to return (at most top_n). Defaults to top_n.
+
+        Returns:
+            List[int]: The hashtag IDs sorted by highest similarity
+        """
+        neighbors = self.neighbors[hashtag_id][:limit]
+        return neighbors[neighbors != -1].tolist()
+
+    def diversify(self, hashtag_ids: List[int], k: int = 10, threshold: float = 0.5) -> List[int]:
+        """Re-rank hashtags so near-synonyms of a better ranked hashtag are left out
+
+        Args:
+            hashtag_ids (List[int]): The candidate hashtag IDs sorted by highest score (should be longer than k)
+            k (int, optional): The number of hashtags to return. Defaults to 10.
+            threshold (float, optional): The similarity from which two hashtags count as near-synonyms. Defaults to 0.5.
+
+        Returns:
+            List[int]: The first k candidates that are not near-synonyms of an earlier one
+        """
+        selected = []
+        selected_set = set()
+        blocked = set() # Near-synonyms of the selected hashtags
+        for hashtag_id in hashtag_ids:
+            if len(selected) == k:
+                break
+            hashtag_id = int(hashtag_id)
+            if hashtag_id in blocked:
+                continue
+            synonyms = self.neighbors[hashtag_id][self.similarities[hashtag_id] >= threshold].tolist()
+            # Neighbor lists are truncated so the similarity is checked from both sides
+            if selected_set.isdisjoint(synonyms):
+                selected.append(hashtag_id)
+                selected_set.add(hashtag_id)
+                blocked.update(synonyms)
+        return selected
+
+    def save(self, database: mysql.connector.MySQLConnection, model_id: int, batch_size: int, codec: str = "zlib"):
+        """Save the co-occurrence counts with a model in a MySQL database
+
+        Args:
+            database (mysql.connector.MySQLConnection): The MySQL database connection to use
+            model_id (int): The model ID to save with (overwritten if it exists)
+            batch_size (int): The batch size for inserting rows
+            codec (str, optional): The compression of the rows ("none", "zlib" or "lzma"). Defaults to "zlib".
+        """
+        cursor = database.cursor()
+        cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS cooccurrences_{model_id} (
+            hashtag_id MEDIUMINT UNSIGNED NOT NULL,
+            hashtags MEDIUMBLOB NOT NULL,
+            PRIMARY KEY (hashtag_id)
+        );
+        """)
+        cursor.execute(f"TRUNCATE TABLE cooccurrences_{model_id}")
+        database.commit()
+
+        hashtag_ids = numpy.flatnonzero(numpy.diff(self.indptr)) # Hashtags never used with another one have no row
+        for low in range(0, len(hashtag_ids), batch_size):
+            cursor.executemany(
+                f"""
+                INSERT INTO cooccurrences_{model_id} (hashtag_id, hashtags) VALUES (%s, %s)
+                """,
+                [
+                    (int(hashtag_id), encode_sparse_row(
+                        self.indices[self.indptr[hashtag_id]:self.indptr[hashtag_id+1]],
+                        self.counts[self.indptr[hashtag_id]:self.indptr[hashtag_id+1]],
+                        codec
+                    ))
+                    for hashtag_id in hashtag_ids[low:low+batch_size]
+                ]
+            )
+        database.commit()
+        cursor.close()
+        print("Co-occurrence data saved")
+
+    @classmethod
+    def load(cls,
+        database: mysql.connector.MySQLConnection,
+        model_id: int,
+        hashtag_frequencies: numpy.ndarray,
+        batch_size: int = 1000,
+        top_n: int = 20) -> HashtagCooccurrence:
+        """Load the co-occurrence counts of a model from a MySQL database
+
+        Args:
+            database (mysql.connector.MySQLConnection): The MySQL database connection to use
+            model_id (int): ID of the model
+            hashtag_frequencies (numpy.ndarray): The hashtag frequencies of the model
+            batch_size (int, optional): Batch size for fetching rows. Defaults to 1000.
+            top_n (int, optional): The length of the neighbor lists. Defaults to 20.
+
+        Returns:
+            HashtagCooccurrence: The co-occurrences, None if the model was saved without them
+        """
+        cursor = database.cursor()
+        cursor.execute("SHOW TABLES LIKE %s", (f"cooccurrences_{model_id}",))
+        if not cursor.fetchall():
+            cursor.close()
+            return None
+
+        cursor.execute(f"SELECT * FROM cooccurrences_{model_id} ORDER BY hashtag_id ASC")
+        row_lengths = numpy.zeros(len(hashtag_frequencies), dtype=numpy.int64)
+        indices = []
+        counts = []
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for hashtag_id, blob in rows:
+                row_indices, row_counts, _ = decode_sparse_row(blob.encode() if type(blob) == str else blob, numpy.int32)
+                row_lengths[hashtag_id] = len(row_indices)
+                indices.append(row_indices.astype(numpy.int32))
+                counts.append(row_counts)
+        cursor.close()
+        print("Co-occurrence data loaded")
+
+        indptr = numpy.zeros(len(hashtag_frequencies) + 1, dtype=numpy.int64)
+        numpy.cumsum(row_lengths, out=indptr[1:])
+        return cls(
+            indptr,
+            numpy.concatenate(indices) if indices else numpy.zeros(0, dtype=numpy.int32),
+            numpy.concatenate(counts) if counts else numpy.zeros(0, dtype=numpy.int32),
+            hashtag_frequencies,
+            top_n
+        )
@@ -0,0 +1,141 @@
+from __future__ import annotations
+from typing import List, Union
+from bisect import bisect_left, bisect_right
+from itertools import groupby
+import numpy, sys
+
+from .Vocabulary import VocabularyStrings
+
+class _SortedKeys:
+    def __init__(self, buffer: memoryview, offsets: memoryview, order: memoryview, length: int = None):
+        """Sequence of the folded hashtags in sorted order, read from the UTF-8 buffer on access so bisect can search it
+        With a length every hashtag is cut to its first length bytes."""
+        self._buffer = buffer
+        self._offsets = offsets
+        self._order = order
+        self._length = length
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def __getitem__(self, position: int) -> bytes:
+        hashtag_id = self._order[position]
+        start = self._offsets[hashtag_id]
+        end = self._offsets[hashtag_id+1]
+        if self._length != None:
+            end = min(end, start + self._length)
+        return self._buffer[start:end].tobytes()
+
+class HashtagIndex:
+    def __init__(self, hashtags: Union[List[str], VocabularyStrings], hashtag_frequencies: numpy.ndarray, top_count: int = 10, cache_threshold: int = 256):
+        """Case insensitive prefix index of hashtags ranked by frequency
+        Hashtags are sorted by their casefolded UTF-8 bytes (same order as the strings) so a prefix is a contiguous
+        range found by binary search. Only the sorted IDs are kept, the bytes are read from the vocabulary's buffer,
+        or from a folded copy of it when some hashtags change when casefolded.
+        Ranges longer than cache_threshold have their top hashtags precomputed, shorter ones are ranked on request.
+
+        Args:
+            hashtags (Union[List[str], VocabularyStrings]): The hashtag strings (index is the hashtag ID)
+            hashtag_frequencies (numpy.ndarray): The frequency of each hashtag
+            top_count (int, optional): The largest number of completions returned. Defaults to 10.
+            cache_threshold (int, optional): Prefix ranges longer than this are precomputed. Defaults to 256.
+        """
+        self.top_count = top_count
+        self.cache_threshold = cache_threshold
+
+        encoded = []
+        unchanged = True # Whether casefolding left every hashtag as it is
+        for hashtag in hashtags:
+            folded = hashtag.casefold()
+            unchanged = unchanged and folded == hashtag
+            encoded.append(folded.encode())
+        self._shared = unchanged and isinstance(hashtags, VocabularyStrings)
+        if self._shared:
+            self._buffer = hashtags.vocabulary.buffer
+            self._offsets = hashtags.vocabulary.offsets
+        else:
+            self._offsets = numpy.zeros(len(encoded) + 1, dtype=numpy.int64)
+            numpy.cumsum([ len(folded) for folded in encoded ], out=self._offsets[1:])
+            self._buffer = numpy.frombuffer(b"".join(encoded), dtype=numpy.uint8)
+        self._order = numpy.array(sorted(range(len(encoded)), key=encoded.__getitem__), dtype=numpy.int64) # Sorted position -> hashtag ID
+        del encoded
+        self._frequencies = numpy.asarray(hashtag_frequencies)[self._order] # By sorted position
+        # Indexing memoryviews gives plain ints and bytes, which is several times faster than numpy scalars
+        self._buffer_view = memoryview(numpy.ascontiguousarray(self._buffer))
+        self._offsets_view = memoryview(numpy.ascontiguousarray(self._offsets))
+        self._order_view = memoryview(self._order)
+        self._keys = _SortedKeys(self._buffer_view, self._offsets_view, self._order_view)
+        self._cache = {} # Folded UTF-8 prefix -> top hashtag IDs
+
+        self._cache[b""] = self._rank(0, len(self._order))
+        lengths = numpy.diff(self._offsets)[self._order] # Byte length by sorted position
+        length = 1
+        while True:
+            large = 0
+            position = 0
+            cut = _SortedKeys(self._buffer_view, self._offsets_view, self._order_view, length)
+            keys = ( cut[index] if lengths[index] >= length else None for index in range(len(cut)) )
+            for prefix, group in groupby(keys):
+                size = sum(1 for _ in group)
+                if prefix != None and size > cache_threshold:
+                    # A prefix ending inside a multi-byte character is never looked up, longer ones may still be cached
+                    if _is_complete(prefix):
+                        self._cache[prefix] = self._rank(position, position + size)
+                    large += 1
+                position += size
+            if large == 0:
+                break
+            length += 1
+
+    @property
+    def nbytes(self) -> int:
+        """Get the memory used by the index, a buffer shared with the vocabulary is counted by the vocabulary
+
+        Returns:
+            int: The size in bytes
+        """
+        nbytes = (
+            self._order.nbytes + self._frequencies.nbytes
+            + sum(sys.getsizeof(prefix) + top.nbytes for prefix, top in self._cache.items())
+        )
+        if not self._shared:
+            nbytes += self._buffer.nbytes + self._offsets.nbytes
+        return nbytes
+
+    def _rank(self, low: int, high: int) -> numpy.ndarray:
+        frequencies = self._frequencies[low:high]
+        count = min(self.top_count, high - low)
+        if count <= 0:
+            return numpy.zeros(0, dtype=numpy.int64)
+        top = numpy.argpartition(-frequencies, count - 1)[:count]
+        top = top[numpy.argsort(-frequencies[top], kind="stable")]
+        return self._order[low + top]
+
+    def complete(self, prefix: str, limit: int = None) -> List[int]:
+        """Get the most frequent hashtags starting with a prefix
+
+        Args:
+            prefix (str): The start of the hashtag (case insensitive, a leading # is ignored)
+            limit (int, optional): The number of hashtags to return (at most top_count). Defaults to top_count.
+
+        Returns:
+            List[int]: The hashtag IDs sorted by highest frequency
+        """
+        if limit == None:
+            limit = self.top_count
+        prefix = prefix.lstrip("#").casefold().encode()
+        try:
+            top = self._cache[prefix]
+        except KeyError:
+            low = bisect_left(self._keys, prefix)
+            # Hashtags cut to the prefix length are sorted too, the range ends after the last one equal to the prefix
+            high = bisect_right(_SortedKeys(self._buffer_view, self._offsets_view, self._order_view, len(prefix)), prefix, low)
+            top = self._rank(low, high)
+        return top[:limit].tolist()
+
+def _is_complete(prefix: bytes) -> bool:
+    try:
+        prefix.decode()
+    except UnicodeDecodeError:
+        return False
+    return True
@@ -0,0 +1,169 @@
+from __future__ import annotations
+from typing import List
+import mysql.connector, numpy, sys, time
+
+from .utils import tweet_id_to_timestamp, timestamp_to_tweet_id
+
+class HashtagPriors:
+    def __init__(self,
+        hashtag_count: int,
+        bucket_seconds: int = 3600,
+        bucket_count: int = 168,
+        half_life: float = 86400):
+        """Time-bucketed hashtag frequencies with exponential decay
+        Only the hashtags used in a bucket are stored for it, most hashtags are never used in a given week.
+
+        Args:
+            hashtag_count (int): The number of hashtags in the model
+            bucket_seconds (int, optional): The length of a bucket in seconds. Defaults to 3600.
+            bucket_count (int, optional): The number of buckets kept in the ring buffer. Defaults to 168.
+            half_life (float, optional): The time in seconds for a count to lose half its weight. Defaults to 86400.
+        """
+        self.bucket_seconds = bucket_seconds
+        self.bucket_count = bucket_count
+        self.decay = 0.5 ** (bucket_seconds / half_life) # Weight multiplier per bucket
+
+        self.counts = [ {} for _ in range(bucket_count) ] # Hashtag ID -> count, for each slot of the ring buffer
+        self.buckets = numpy.full(bucket_count, -1, dtype=numpy.int64) # Bucket number stored in each slot, -1 if empty
+        self.latest_bucket = -1
+        # Decayed sum of all the buckets relative to the latest bucket, kept up to date on every change
+        # so that the prior can be read without summing the ring buffer
+        self.decayed = numpy.zeros(hashtag_count, dtype=numpy.float64)
+
+        self.last_tweet_id = 0
+
+    def _advance(self, bucket: int):
+        steps = bucket - self.latest_bucket
+        if self.latest_bucket == -1 or steps >= self.bucket_count:
+            for counts in self.counts:
+                counts.clear()
+            self.buckets[:] = -1
+            self.decayed[:] = 0
+        else:
+            self.decayed *= self.decay ** steps
+            for expired in range(self.latest_bucket + 1, bucket + 1):
+                slot = expired % self.bucket_count
+                if self.buckets[slot] != -1:
+                    counts = self.counts[slot]
+                    if counts:
+                        hashtag_ids = numpy.fromiter(counts.keys(), dtype=numpy.int64, count=len(counts))
+                        self.decayed[hashtag_ids] -= self.decay ** (bucket - self.buckets[slot]) * numpy.fromiter(counts.values(), dtype=numpy.float64, count=len(counts))
+                        counts.clear()
+                    self.buckets[slot] = -1
+            numpy.maximum(self.decayed, 0, out=self.decayed) # Float error can leave tiny negative values
+        self.latest_bucket = bucket
+
+    def add(self, hashtag_ids: List[int], timestamp: float):
+        """Count hashtag uses at a point in time
+
+        Args:
+            hashtag_ids (List[int]): The IDs of the hashtags used
+            timestamp (float): The UNIX timestamp in seconds
+        """
+        bucket = int(timestamp // self.bucket_seconds)
+        if bucket > self.latest_bucket:
+            self._advance(bucket)
+        elif bucket <= self.latest_bucket - self.bucket_count:
+            return # Older than the ring buffer
+        slot = bucket % self.bucket_count
+        self.buckets[slot] = bucket
+        counts = self.counts[slot]
+        for hashtag_id in hashtag_ids:
+            counts[hashtag_id] = counts.get(hashtag_id, 0) + 1
+        numpy.add.at(self.decayed, hashtag_ids, self.decay ** (self.latest_bucket - bucket))
+
+    def add_tweet(self, model, tweet_id: int, hashtags: List[str]):
+        """Count the hashtags of a tweet, the time is taken from the tweet ID
+
+        Args:
+            model (BaseModel): The model the hashtag IDs belong to
+            tweet_id (int): The ID of the tweet
+            hashtags (List[str]): The hashtags of the tweet (hashtags not in the model are ignored)
+        """
+        hashtag_ids = []
+        for hashtag in hashtags:
+            try:
+                hashtag_ids.append(model.get_hashtag_id(hashtag))
+            except KeyError:
+                pass
+        if hashtag_ids:
+            self.add(hashtag_ids, tweet_id_to_timestamp(tweet_id))
+        self.last_tweet_id = max(self.last_tweet_id, int(tweet_id))
+
+    def refresh(self, database: mysql.connector.MySQLConnection, model, batch_size: int = 10000) -> int:
+        """Count the tweets saved since the last refresh
+
+        Args:
+            database (mysql.connector.MySQLConnection): The MySQL database connection to use
+            model (BaseModel): The model the hashtag IDs belong to
+            batch_size (int, optional): Batch size for fetching tweets. Defaults to 10000.
+
+        Returns:
+            int: The number of new tweets counted
+        """
+        cursor = database.cursor()
+        cursor.execute(
+            "SELECT id, hashtags FROM tweets WHERE id > %s ORDER BY id ASC",
+            (self.last_tweet_id,)
+        )
+        count = 0
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for tweet_id, hashtags in rows:
+                self.add_tweet(model, tweet_id, hashtags.split(","))
+                count += 1
+        cursor.close()
+        return count
+
+    @property
+    def nbytes(self) -> int:
+        """Get the memory used by the ring buffer
+
+        Returns:
+            int: The size in bytes
+        """
+        # Every entry holds a key and a value int object (28 bytes each, small ints are shared but this stays an upper bound)
+        return (
+            sum(sys.getsizeof(counts) + 56 * len(counts) for counts in self.counts)
+            + self.buckets.nbytes + self.decayed.nbytes
+        )
+
+    def prior(self, timestamp: float = None) -> numpy.ndarray:
+        """Get the current (decayed) share of each hashtag
+
+        Args:
+            timestamp (float, optional): The UNIX timestamp in seconds to get the prior at. Defaults to now.
+
+        Returns:
+            numpy.ndarray: Probabilities with the index of the hashtag ID (sums to 1, or all 0 if nothing was counted)
+        """
+        if timestamp == None:
+            timestamp = time.time()
+        total = self.decayed.sum()
+        if total <= 0:
+            return numpy.zeros(len(self.decayed))
+        # Decaying everything by the same amount does not change the shares, unless every count has expired
+        if int(timestamp // self.bucket_seconds) - self.latest_bucket >= self.bucket_count:
+            return numpy.zeros(len(self.decayed))
+        return self.decayed / total
+
+    @classmethod
+    def build(cls, database: mysql.connector.MySQLConnection, model, batch_size: int = 10000, **kwargs) -> HashtagPriors:
+        """Build hashtag priors for a model from the tweets table
+
+        Args:
+            database (mysql.connector.MySQLConnection): The MySQL database connection to use
+            model (BaseModel): The model the hashtag IDs belong to
+            batch_size (int, optional): Batch size for fetching tweets. Defaults to 10000.
+            **kwargs: Passed to HashtagPriors()
+
+        Returns:
+            HashtagPriors: The hashtag priors
+        """
+        priors = cls(len(model.hashtags), **kwargs)
+        # Tweets older than the ring buffer would be ignored anyway
+        priors.last_tweet_id = timestamp_to_tweet_id(time.time() - priors.bucket_count * priors.bucket_seconds) - 1
+        priors.refresh(database, model, batch_size)
+        return priors
@@ -0,0 +1,172 @@
+from __future__ import annotations
+from typing import Dict, List, Tuple
+from collections import Counter
+import numpy
+
+COUNT_LIMIT = int(numpy.iinfo(numpy.int16).max) # Relations cells saturate here, the count above it is kept in LargeCounts
+
+def accumulate_pairs(relations: numpy.ndarray, hashtag_ids: numpy.ndarray, word_ids: numpy.ndarray, excess: Dict[int, int], hashtag_offset: int = 0):
+    """Count (hashtag, word) pairs into a relations matrix without wrapping
+    Cells saturate at COUNT_LIMIT and whatever goes past it is added to excess
+
+    Args:
+        relations (numpy.ndarray): The int16 relations rows to count into (shape is (rows, word_count))
+        hashtag_ids (numpy.ndarray): The hashtag ID of every pair
+        word_ids (numpy.ndarray): The word ID of every pair
+        excess (Dict[int, int]): Counts above COUNT_LIMIT by hashtag_id * word_count + word_id, updated in place
+        hashtag_offset (int, optional): The hashtag ID of the first row. Defaults to 0.
+    """
+    word_count = relations.shape[1]
+    codes, counts = numpy.unique(
+        (numpy.asarray(hashtag_ids, dtype=numpy.int64) - hashtag_offset) * word_count + numpy.asarray(word_ids, dtype=numpy.int64),
+        return_counts=True
+    )
+    rows = codes // word_count
+    columns = codes % word_count
+    totals = relations[rows, columns].astype(numpy.int64) + counts
+    relations[rows, columns] = numpy.minimum(totals, COUNT_LIMIT)
+    over = numpy.flatnonzero(totals > COUNT_LIMIT)
+    for code, extra in zip((codes[over] + hashtag_offset * word_count).tolist(), (totals[over] - COUNT_LIMIT).tolist()):
+        excess[code] = excess.get(code, 0) + extra
+
+class LargeCounts:
+    def __init__(self, hashtag_ids: numpy.ndarray, word_ids: numpy.ndarray, excess: numpy.ndarray):
+        """The part of relations counts above COUNT_LIMIT, for the few cells that need more than 16 bits
+        The true count of a cell is relations[hashtag_id, word_id] + its excess here (0 if it isn't here).
+
+        Args:
+            hashtag_ids (numpy.ndarray): The hashtag ID of every large cell
+            word_ids (numpy.ndarray): The word ID of every large cell
+            excess (numpy.ndarray): The count above COUNT_LIMIT of every large cell
+        """
+        # Sorted by word so the cells of the words of a text are found by binary search
+        order = numpy.lexsort((hashtag_ids, word_ids))
+        self.hashtag_ids = numpy.asarray(hashtag_ids, dtype=numpy.int64)[order]
+        self.word_ids = numpy.asarray(word_ids, dtype=numpy.int64)[order]
+        self.excess = numpy.asarray(excess, dtype=numpy.int64)[order]
+
+    @classmethod
+    def empty(cls) -> LargeCounts:
+        return cls(numpy.zeros(0), numpy.zeros(0), numpy.zeros(0))
+
+    @classmethod
+    def from_excess(cls, excess: Dict[int, int], word_count: int) -> LargeCounts:
+        """Create large counts from the excess collected by accumulate_pairs
+
+        Args:
+            excess (Dict[int, int]): Counts above COUNT_LIMIT by hashtag_id * word_count + word_id
+            word_count (int): The unique word count of the model
+
+        Returns:
+            LargeCounts: The large counts
+        """
+        codes = numpy.array(list(excess.keys()), dtype=numpy.int64)
+        return cls(codes // word_count, codes % word_count, numpy.array(list(excess.values()), dtype=numpy.int64))
+
+    @classmethod
+    def concatenate(cls, parts: List[LargeCounts], hashtag_offsets: List[int] = None) -> LargeCounts:
+        """Join the large counts of consecutive hashtag ranges
+
+        Args:
+            parts (List[LargeCounts]): The large counts of each range
+            hashtag_offsets (List[int], optional): The hashtag ID of the first row of each range. Defaults to all 0.
+
+        Returns:
+            LargeCounts: The large counts of all the ranges
+        """
+        if hashtag_offsets == None:
+            hashtag_offsets = [0] * len(parts)
+        return cls(
+            numpy.concatenate([ part.hashtag_ids + offset for part, offset in zip(parts, hashtag_offsets) ] + [numpy.zeros(0, dtype=numpy.int64)]),
+            numpy.concatenate([ part.word_ids for part in parts ] + [numpy.zeros(0, dtype=numpy.int64)]),
+            numpy.concatenate([ part.excess for part in parts ] + [numpy.zeros(0, dtype=numpy.int64)])
+        )
+
+    def __len__(self) -> int:
+        return len(self.excess)
+
+    @property
+    def nbytes(self) -> int:
+        return self.hashtag_ids.nbytes + self.word_ids.nbytes + self.excess.nbytes
+
+    def add_columns(self, scores: numpy.ndarray, word_ids: List[int], hashtag_range: Tuple[int, int] = None) -> numpy.ndarray:
+        """Add the excess of the large cells of some words to the sum of their relations columns
+
+        Args:
+            scores (numpy.ndarray): The summed relations columns (a wide enough integer or float dtype), changed in place
+            word_ids (List[int]): The IDs of the summed words (repeated words count again)
+            hashtag_range (Tuple[int, int], optional): The (first, last + 1) hashtag IDs of the scores. Defaults to all hashtags.
+
+        Returns:
+            numpy.ndarray: The scores
+        """
+        if len(self.excess) == 0:
+            return scores
+        low, high = hashtag_range if hashtag_range != None else (0, len(scores))
+        for word_id, repeats in Counter(word_ids).items():
+            start = numpy.searchsorted(self.word_ids, word_id, side="left")
+            end = numpy.searchsorted(self.word_ids, word_id, side="right")
+            if start == end:
+                continue
+            hashtag_ids = self.hashtag_ids[start:end]
+            in_range = (hashtag_ids >= low) & (hashtag_ids < high)
+            scores[hashtag_ids[in_range] - low] += repeats * self.excess[start:end][in_range]
+        return scores
+
+    def add_bags(self, scores: numpy.ndarray, bags: numpy.ndarray, unique_words: numpy.ndarray, hashtag_range: Tuple[int, int]) -> numpy.ndarray:
+        """Add the excess of the large cells to the scores of a batch of bags of words
+
+        Args:
+            scores (numpy.ndarray): The scores of the batch, bags @ relations[low:high][:,unique_words].T, changed in place
+            bags (numpy.ndarray): The word counts of each text (shape is (batch, len(unique_words)))
+            unique_words (numpy.ndarray): The sorted IDs of the words of the bags
+            hashtag_range (Tuple[int, int]): The (first, last + 1) hashtag IDs of the scores
+
+        Returns:
+            numpy.ndarray: The scores
+        """
+        if len(self.excess) == 0 or len(unique_words) == 0:
+            return scores
+        low, high = hashtag_range
+        columns = numpy.minimum(numpy.searchsorted(unique_words, self.word_ids), len(unique_words) - 1)
+        cells = numpy.flatnonzero(
+            (unique_words[columns] == self.word_ids) & (self.hashtag_ids >= low) & (self.hashtag_ids < high)
+        )
+        if len(cells):
+            numpy.add.at(scores.T, self.hashtag_ids[cells] - low, (bags[:,columns[cells]] * self.excess[cells]).T)
+        return scores
+
+    def row(self, hashtag_id: int) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """Get the large cells of a hashtag
+
+        Args:
+            hashtag_id (int): The hashtag ID
+
+        Returns:
+            Tuple[numpy.ndarray, numpy.ndarray]: The (sorted word IDs, excess counts) of the hashtag's large cells
+        """
+        cells = numpy.flatnonzero(self.hashtag_ids == hashtag_id)
+        return self.word_ids[cells], self.excess[cells]
+
+    def rows(self) -> Dict[int, Tuple[numpy.ndarray, numpy.ndarray]]:
+        """Get the large cells of every hashtag that has some
+
+        Returns:
+            Dict[int, Tuple[numpy.ndarray, numpy.ndarray]]: Hashtag ID -> (sorted word IDs, excess counts)
+        """
+        return { int(hashtag_id): self.row(hashtag_id) for hashtag_id in numpy.unique(self.hashtag_ids) }
+
+    def dense_rows(self, relations: numpy.ndarray, hashtag_offset: int = 0) -> numpy.ndarray:
+        """Get relations rows with their true counts
+
+        Args:
+            relations (numpy.ndarray): Relations rows (shape is (rows, word_count))
+            hashtag_offset (int, optional): The hashtag ID of the first row. Defaults to 0.
+
+        Returns:
+            numpy.ndarray: The true counts as int64 (same shape as relations)
+        """
+        counts = numpy.asarray(relations).astype(numpy.int64)
+        in_range = (self.hashtag_ids >= hashtag_offset) & (self.hashtag_ids < hashtag_offset + len(counts))
+        counts[self.hashtag_ids[in_range] - hashtag_offset, self.word_ids[in_range]] += self.excess[in_range]
+        return counts
@@ -4,6 +4,10 @@ import mysql.connector, numpy, time
 
 from nltk.corpus import wordnet
 
+from .Vocabulary import Vocabulary, VocabularyStrings
+from .HashtagCooccurrence import HashtagCooccurrence
+from .encoding import encode_relations_row, decode_relations_row
+from .LargeCounts import LargeCounts, COUNT_LIMIT, accumulate_pairs
 from .utils import tag_to_inttag, inttag_to_tag, tokenize_tweet, tag_words, filter_important_words, draw_progress_bar
 
 class BaseModel:
@@ -16,16 +20,19 @@ class BaseModel:
         model_id: int):
         self.tweet_count = tweet_count
 
-        self._hashtags = hashtags
-        self._hashtags_array = list(hashtags.keys())
-        self._words = words
-        self._words_array = list(words.keys())
+        # Dicts (from building) are interned into compact vocabularies, their IDs are their insertion order
+        self._hashtags = hashtags if isinstance(hashtags, Vocabulary) else Vocabulary.from_strings(list(hashtags.keys()))
+        self._words = words if isinstance(words, Vocabulary) else Vocabulary.from_strings(list(words.keys()))
 
         self.hashtag_frequencies = hashtag_frequencies
         self.word_tags = word_tags
 
         self.model_id = model_id
 
+        self.priors = None # Optional HashtagPriors used for trending-aware ranking
+        self.cooccurrence = None # Optional HashtagCooccurrence used for related hashtags and diversified ranking
+        self.hashtag_index = None # Optional HashtagIndex used for autocompleting hashtags
+
     def _get_hashtag_words(self, hashtag: str) -> numpy.ndarray:
         """Returns a list of word counts for a hashtag
 
@@ -40,13 +47,27 @@ class BaseModel:
         """
         raise NotImplementedError
 
+    def word_ids_probability(self, word_ids: List[int]) -> numpy.ndarray:
+        """Predict the (relative) probabilities for each hashtag from already tokenized words
+
+        Args:
+            word_ids (List[int]): The IDs of the words in the text
+
+        Raises:
+            NotImplementedError: this function must be overriden
+
+        Returns:
+            numpy.ndarray: List of relative probabilities with the index of the hashtag ID
+        """
+        raise NotImplementedError
+
     @property
-    def hashtags(self):
-        return self._hashtags_array
+    def hashtags(self) -> VocabularyStrings:
+        return self._hashtags.strings
 
     @property
-    def words(self):
-        return self._words_array
+    def words(self) -> VocabularyStrings:
+        return self._words.strings
 
     @property
     def word_count(self) -> int:
@@ -57,6 +78,21 @@ class BaseModel:
         """
         return len(self._words)
 
+    @property
+    def nbytes(self) -> int:
+        """Get the memory used by the arrays of the model, including the vocabularies
+
+        Returns:
+            int: The size in bytes
+        """
+        nbytes = self._hashtags.nbytes + self._words.nbytes + self.hashtag_frequencies.nbytes + self.word_tags.nbytes
+        if self.priors != None:
+            nbytes += self.priors.nbytes
+        if self.cooccurrence != None:
+            nbytes += self.cooccurrence.nbytes
+        if self.hashtag_index != None:
+            nbytes += self.hashtag_index.nbytes
+        return nbytes
 
     def get_hashtag_string(self, hashtag_id: int) -> str:
         """Get a hashtag's string value from its ID
@@ -69,6 +105,20 @@ class BaseModel:
         """
         return self.hashtags[int(hashtag_id)]
 
+    def get_hashtag_id(self, hashtag: str) -> int:
+        """Get a hashtag's ID from its string value
+
+        Args:
+            hashtag (str): The string value of the hashtag
+
+        Raises:
+            KeyError: The hashtag is not in the model
+
+        Returns:
+            int: The ID of the hashtag
+        """
+        return self._hashtags[hashtag]
+
     def get_word_string(self, word_id: int) -> str:
         """Get a word's string value from its ID
 
@@ -119,18 +169,155 @@ class BaseModel:
         
         return probability
 
-    def hashtag_probability(self, hashtag: str) -> int:
+    @classmethod
+    def load(cls, database: mysql.connector.MySQLConnection, model_id: int) -> BaseModel:
+        """Load the vocabulary of a model (everything but the relations) from a MySQL database
+
+        Args:
+            database (mysql.connector.MySQLConnection): The MySQL database connection to use
+            model_id (int): ID of the model to load
+
+        Returns:
+            BaseModel: The loaded model vocabulary
+        """
+        cursor = database.cursor()
+
+        # Fetch model tweet count
+        cursor.execute(
+            "SELECT tweet_count FROM models WHERE id=%s",
+            (model_id,)
+        )
+        tweet_count = cursor.fetchall()[0][0]
+
+        # Fetch hashtags and hashtag frequencies
+        cursor.execute(
+            f"SELECT * FROM hashtags_{model_id} ORDER BY id ASC"
+        )
+        hashtags_data = cursor.fetchall()
+        print("Hashtags data fetched")
+
+        hashtags = Vocabulary.from_strings([ hashtag[1] for hashtag in hashtags_data ])
+        hashtag_frequencies = numpy.array([ hashtag[2] for hashtag in hashtags_data ], dtype=numpy.int32)
+        print("Hashtags data created")
+
+        del hashtags_data
+
+        # Fetch words and word tags
+        cursor.execute(
+            f"SELECT * FROM words_{model_id} ORDER BY id ASC"
+        )
+        words_data = cursor.fetchall()
+        print("Words data fetched")
+
+        words = Vocabulary.from_strings([ word[1] for word in words_data ])
+        word_tags = numpy.array([ word[2] for word in words_data ], dtype=numpy.int16)
+        print("Words data created")
+
+        del words_data
+
+        cursor.close()
+
+        model = BaseModel(
+            tweet_count=tweet_count,
+            hashtags=hashtags,
+            hashtag_frequencies=hashtag_frequencies,
+            words=words,
+            word_tags=word_tags,
+            model_id=model_id
+        )
+        model.cooccurrence = HashtagCooccurrence.load(database, model_id, hashtag_frequencies)
+        return model
+
+    def get_text_word_ids(self, string: str) -> List[int]:
+        """Tokenize a string into the IDs of the words in the model
+
+        Args:
+            string (str): The string to tokenize
+
+        Returns:
+            List[int]: The word IDs (words not in the model are left out)
+        """
+        words, _ = tokenize_tweet(string.lower())
+        return self.get_word_ids(words)
+
+    def get_word_ids(self, words: List[str]) -> List[int]:
+        """Get the IDs of already tokenized words
+
+        Args:
+            words (List[str]): The words (see .utils.tokenize_tweet)
+
+        Returns:
+            List[int]: The word IDs (words not in the model are left out)
+        """
+        words_in_text = []
+
+        for word in words:
+            try:
+                word_id = self._words[word]
+                words_in_text.append(word_id)
+            except KeyError:
+                pass
+
+        return words_in_text
+
+    def hashtag_probability(self, hashtag: str, timestamp: float = None) -> int:
         """Predict the (relative) probability for a hashtag in general
+        If the model has priors the current (decayed) share of the hashtag is used instead of the all-time frequency
 
         Args:
             hashtag (str): The hashtag to calculate the probability for
+            timestamp (float, optional): The UNIX timestamp in seconds to calculate the probability at. Defaults to now.
 
         Returns:
             int: The (relative) probability
         """
+        if self.priors != None:
+            return self.priors.prior(timestamp)[self._hashtags[hashtag]]
         probability = self.hashtag_frequencies[self._hashtags[hashtag]]
         probability /= self.tweet_count
         return probability
+
+    def trending_boost(self, hashtag_probabilities: numpy.ndarray, trending_weight: float) -> numpy.ndarray:
+        """Boost hashtags that are currently used more than average (does nothing without priors)
+
+        Args:
+            hashtag_probabilities (numpy.ndarray): List of relative probabilities with the index of the hashtag ID
+            trending_weight (float): How much to boost trending hashtags
+
+        Returns:
+            numpy.ndarray: The boosted list of relative probabilities
+        """
+        if trending_weight and self.priors != None:
+            prior = self.priors.prior()
+            # prior * len(prior) is 1 for a hashtag used an average amount
+            hashtag_probabilities = hashtag_probabilities * (1 + trending_weight * prior * len(prior))
+        return hashtag_probabilities
+
+    def text_probability(self, string: str, trending_weight: float = 0) -> numpy.ndarray:
+        """Predict the (relative) probabilities for each hashtag
+
+        Args:
+            string (str): The string to predict the probabilities for
+            trending_weight (float, optional): How much to boost hashtags that are currently used more than average (needs priors). Defaults to 0.
+
+        Returns:
+            numpy.ndarray: List of relative probabilities with the index of the hashtag ID
+        """
+        words_in_text = self.get_text_word_ids(string)
+
+        hashtag_probabilities = self.word_ids_probability(words_in_text)
+        hashtag_probabilities = self.trending_boost(hashtag_probabilities, trending_weight)
+
+        # for hashtag in self.hashtags:
+        #     text_hashtag_probability = 1
+        #     for word, inttag in words_and_tags:
+        #         text_hashtag_probability *= self.word_probability(word, inttag, hashtag)
+        #         count += 1
+            
+        #     hashtag_probability = self.hashtag_probability(hashtag)
+        #     hashtag_probabilities[self._hashtags[hashtag]] = text_hashtag_probability# * hashtag_probability
+
+        return hashtag_probabilities
             
 
 class Model(BaseModel):
@@ -141,7 +328,8 @@ class Model(BaseModel):
         words: Dict[str, int],
         word_tags: numpy.ndarray,
         relations: numpy.ndarray,
-        model_id: int = None):
+        model_id: int = None,
+        large_counts: LargeCounts = None):
         if relations.shape != (len(hashtags), len(words)):
             raise TypeError(f"Invalid shape {relations.shape}. Must be (hashtag_count, word_count) : {(len(hashtags), len(words))}")
         if len(hashtags) != len(hashtag_frequencies):
@@ -156,7 +344,8 @@ class Model(BaseModel):
             word_tags=word_tags,
             model_id=model_id
         )
-        self.relations = relations
+        self.relations = relations # Saturates at COUNT_LIMIT, the rest of larger counts is in large_counts
+        self.large_counts = large_counts if large_counts != None else LargeCounts.empty()
 
     def _get_hashtag_words(self, hashtag: str) -> numpy.ndarray:
         """Returns a list of word counts for a hashtag
@@ -164,13 +353,15 @@ class Model(BaseModel):
         Args:
             hashtag (str): The hashtag string
 
-        Raises:
-            NotImplementedError: this function must be overriden
-
         Returns:
             numpy.ndarray: A numpy array with shape (len(words),)
         """
-        return self.relations[self._hashtags[hashtag]]
+        hashtag_id = self._hashtags[hashtag]
+        return self.large_counts.dense_rows(self.relations[hashtag_id:hashtag_id+1], hashtag_id)[0]
+
+    @property
+    def nbytes(self) -> int:
+        return super().nbytes + self.relations.nbytes + self.large_counts.nbytes
 
     @classmethod
     def build(cls, tweets: List[List[str]], logging: bool = True) -> Model:
@@ -272,25 +463,41 @@ class Model(BaseModel):
         start = time.time()
         if logging: print("Creating relations data")
         relations = numpy.zeros((len(hashtags),len(words)), dtype=numpy.int16)
-        for index in range(len(numerized_tweets)):
-            for word_index in range(len(numerized_tweets[index][0])):
-                for hashtag_index in range(len(numerized_tweets[index][1])):
-                    relations[
-                        numerized_tweets[index][1][hashtag_index]
-                    ][
-                        numerized_tweets[index][0][word_index]
-                    ] += 1
+        excess = {} # Counts past what int16 cells can hold, most cells never get there
+        chunk_size = 10000
+        for low in range(0, len(numerized_tweets), chunk_size):
+            pair_hashtags = []
+            pair_words = []
+            for tweet_words, tweet_hashtags in numerized_tweets[low:low+chunk_size]:
+                for hashtag_id in tweet_hashtags:
+                    pair_hashtags.extend([hashtag_id] * len(tweet_words))
+                    pair_words.extend(tweet_words)
+            accumulate_pairs(relations, numpy.array(pair_hashtags, dtype=numpy.int64), numpy.array(pair_words, dtype=numpy.int64), excess)
+        large_counts = LargeCounts.from_excess(excess, len(words))
+        if logging: print(time.time()-start)
+
+        # Create hashtag co-occurrence data
+        start = time.time()
+        if logging: print("Creating co-occurrence data")
+        cooccurrence = HashtagCooccurrence.from_tweets(
+            numpy.array([ hashtag_id for tweet in numerized_tweets for hashtag_id in tweet[1] ], dtype=numpy.int64),
+            numpy.array([ len(tweet[1]) for tweet in numerized_tweets ], dtype=numpy.int64),
+            hashtag_frequencies
+        )
         if logging: print(time.time()-start)
 
         if logging: print("Model built!")
-        return Model(
+        model = Model(
             tweet_count=tweet_count,
             hashtags=hashtags,
             hashtag_frequencies=hashtag_frequencies,
             words=words,
             word_tags=word_tags,
-            relations=relations
+            relations=relations,
+            large_counts=large_counts
         )
+        model.cooccurrence = cooccurrence
+        return model
 
     @classmethod
     def load(cls, database: mysql.connector.MySQLConnection, batch_size: int, model_id: int) -> Model:
@@ -304,52 +511,48 @@ class Model(BaseModel):
         Returns:
             Model: The loaded model object
         """
-        cursor = database.cursor()
-
-        # Fetch model tweet count
-        cursor.execute(
-            "SELECT tweet_count FROM models WHERE id=%s",
-            (model_id,)
-        )
-        tweet_count = cursor.fetchall()[0][0]
-
-        # Fetch hashtags and hashtag frequencies
-        cursor.execute(
-            f"SELECT * FROM hashtags_{model_id} ORDER BY id ASC"
+        vocabulary = BaseModel.load(database, model_id)
+        relations, large_counts = cls.load_relations(database, batch_size, model_id, vocabulary.word_count, (0, len(vocabulary.hashtags)))
+
+        model = Model(
+            tweet_count=vocabulary.tweet_count,
+            hashtags=vocabulary._hashtags,
+            hashtag_frequencies=vocabulary.hashtag_frequencies,
+            words=vocabulary._words,
+            word_tags=vocabulary.word_tags,
+            relations=relations,
+            model_id=model_id,
+            large_counts=large_counts
         )
-        hashtags_data = cursor.fetchall()
-        print("Hashtags data fetched")
+        model.cooccurrence = vocabulary.cooccurrence
+        return model
 
-        hashtags = {}
-        for hashtag in hashtags_data:
-            hashtags[hashtag[1]] = len(hashtags)
-        hashtag_frequencies = numpy.array([ hashtag[2] for hashtag in hashtags_data ], dtype=numpy.int32)
-        print("Hashtags data created")
-
-        del hashtags_data
-
-        # Fetch words and word tags
-        cursor.execute(
-            f"SELECT * FROM words_{model_id} ORDER BY id ASC"
-        )
-        words_data = cursor.fetchall()
-        print("Words data fetched")
+    @staticmethod
+    def load_relations(database: mysql.connector.MySQLConnection, batch_size: int, model_id: int, word_count: int, hashtag_range: Tuple[int, int]) -> Tuple[numpy.ndarray, LargeCounts]:
+        """Load the relations of a range of hashtags from a MySQL database
 
-        words = {}
-        for word in words_data:
-            words[word[1]] = len(words)
-        word_tags = numpy.array([ word[2] for word in words_data ], dtype=numpy.int16)
-        print("Words data created")
+        Args:
+            database (mysql.connector.MySQLConnection): The MySQL database connection to use
+            batch_size (int): Batch size for relations
+            model_id (int): ID of the model to load
+            word_count (int): The unique word count of the model
+            hashtag_range (Tuple[int, int]): The (first, last + 1) hashtag IDs to load
 
-        del words_data
+        Returns:
+            Tuple[numpy.ndarray, LargeCounts]: A numpy array with shape (last + 1 - first, word_count), row 0 is hashtag ID first,
+                and the large counts of the range (with hashtag IDs relative to first)
+        """
+        cursor = database.cursor()
+        low, high = hashtag_range
 
-        # Fetch relations
         cursor.execute(
-            f"SELECT * FROM relations_{model_id} ORDER BY hashtag_id ASC"
+            f"SELECT * FROM relations_{model_id} WHERE hashtag_id >= %s AND hashtag_id < %s ORDER BY hashtag_id ASC",
+            (low, high)
         )
         print("Query for relations executed")
-        relations = numpy.zeros((len(hashtags),len(words)), dtype=numpy.int16)
+        relations = numpy.zeros((high - low, word_count), dtype=numpy.int16)
         print("Relations table created")
+        large_rows = []
         count = 0
         while True:
             print(f"{count} relations rows loaded")
@@ -357,30 +560,32 @@ class Model(BaseModel):
             if rows:
                 for hashtag_id, array_bytes in rows:
                     # Rarelly array_bytes is a bytearray instead of a string, I have not managed to find the cause of this randomness
-                    relations[hashtag_id] += numpy.frombuffer(array_bytes.encode() if type(array_bytes) == str else array_bytes, dtype=numpy.int16)
+                    row = relations[hashtag_id - low]
+                    word_ids, excess = decode_relations_row(array_bytes.encode() if type(array_bytes) == str else array_bytes, row)
+                    # Models built before counts saturated hold counts past 32767 wrapped to negative numbers
+                    wrapped = numpy.flatnonzero(row < 0)
+                    if len(wrapped):
+                        row_excess = row[wrapped].astype(numpy.int64) + 65536 - COUNT_LIMIT
+                        row[wrapped] = COUNT_LIMIT
+                        word_ids = numpy.concatenate((word_ids, wrapped))
+                        excess = numpy.concatenate((excess, row_excess))
+                    if len(word_ids):
+                        large_rows.append(LargeCounts(numpy.full(len(word_ids), hashtag_id - low), word_ids, excess))
                     count += 1
             else:
                 break
 
         cursor.close()
-        
-        return Model(
-            tweet_count=tweet_count,
-            hashtags=hashtags,
-            hashtag_frequencies=hashtag_frequencies,
-            words=words,
-            word_tags=word_tags,
-            relations=relations,
-            model_id=model_id
-        )
+        return relations, LargeCounts.concatenate(large_rows)
 
-    def save(self, database: mysql.connector.MySQLConnection, batch_size: int, model_id: int = None) -> int:
+    def save(self, database: mysql.connector.MySQLConnection, batch_size: int, model_id: int = None, codec: str = "zlib") -> int:
         """Save the model to a MySQL databse
 
         Args:
             database (mysql.connector.MySQLConnection): The MySQL database connection to use
             batch_size (int): The batch size for inserting relations
             model_id (int, optional): The model ID to use (overwrites if the model ID already exists). If None then AUTO_INCREMENT is used. Defaults to None.
+            codec (str, optional): Encoding of the relations rows, see .encoding.encode_relations_row. Defaults to "zlib".
 
         Returns:
             int: The model ID of the saved model
@@ -410,10 +615,12 @@ class Model(BaseModel):
         CREATE TABLE IF NOT EXISTS hashtags_{model_id} (
             id MEDIUMINT UNSIGNED NOT NULL UNIQUE AUTO_INCREMENT PRIMARY KEY,
             hashtag VARCHAR(1120) NOT NULL UNIQUE,
-            frequency MEDIUMINT UNSIGNED NOT NULL
+            frequency INT UNSIGNED NOT NULL
         ) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin;
         """)
         cursor.execute(f"TRUNCATE TABLE hashtags_{model_id}")
+        # Tables created before frequencies could pass 16777215 have a MEDIUMINT column
+        cursor.execute(f"ALTER TABLE hashtags_{model_id} MODIFY frequency INT UNSIGNED NOT NULL")
         cursor.execute(f"""
         CREATE TABLE IF NOT EXISTS words_{model_id} (
             id MEDIUMINT UNSIGNED NOT NULL UNIQUE AUTO_INCREMENT PRIMARY KEY,
@@ -455,9 +662,10 @@ class Model(BaseModel):
         print("Words data saved")
 
         # Save relations
+        large_rows = self.large_counts.rows()
         def _relations_iterator(relations):
             for hashtag_id in range(len(relations)):
-                yield (hashtag_id, relations[hashtag_id].tobytes())
+                yield (hashtag_id, encode_relations_row(relations[hashtag_id], codec, large_rows.get(hashtag_id)))
         complete = False
         generator = _relations_iterator(self.relations)
         count = 0
@@ -478,6 +686,13 @@ class Model(BaseModel):
             )
         database.commit()
 
+        # Save co-occurrences, a model without them must not keep the ones of an earlier model with the same ID
+        if self.cooccurrence != None:
+            self.cooccurrence.save(database, model_id, batch_size, "zlib" if codec == "dense" else codec)
+        else:
+            cursor.execute(f"DROP TABLE IF EXISTS cooccurrences_{model_id}")
+            database.commit()
+
         # # Save relations
         # data = [ (hashtag_id, word_id, frequency) for (hashtag_id, word_id), frequency in numpy.ndenumerate(self.relations) if frequency != 0]
         # print("Created relations data")
@@ -493,36 +708,14 @@ class Model(BaseModel):
         cursor.close()
         return model_id
 
-    def text_probability(self, string: str) -> numpy.ndarray:
-        """Predict the (relative) probabilities for each hashtag
+    def word_ids_probability(self, word_ids: List[int]) -> numpy.ndarray:
+        """Predict the (relative) probabilities for each hashtag from already tokenized words
 
         Args:
-            string (str): The string to predict the probabilities for
+            word_ids (List[int]): The IDs of the words in the text
 
         Returns:
             numpy.ndarray: List of relative probabilities with the index of the hashtag ID
         """
-        words, _ = tokenize_tweet(string.lower())
-
-        words_in_text = []
-        
-        for word in words:
-            try:
-                word_id = self._words[word]
-                words_in_text.append(word_id)
-            except KeyError:
-                pass
-        
-        text_relations = self.relations[:,words_in_text]
-        hashtag_probabilities = text_relations.sum(axis=1)
-
-        # for hashtag in self.hashtags:
-        #     text_hashtag_probability = 1
-        #     for word, inttag in words_and_tags:
-        #         text_hashtag_probability *= self.word_probability(word, inttag, hashtag)
-        #         count += 1
-            
-        #     hashtag_probability = self.hashtag_probability(hashtag)
-        #     hashtag_probabilities[self._hashtags[hashtag]] = text_hashtag_probability# * hashtag_probability
-
-        return hashtag_probabilities
+        text_relations = self.relations[:,word_ids]
+        return self.large_counts.add_columns(text_relations.sum(axis=1), word_ids)
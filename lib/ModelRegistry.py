@@ -0,0 +1,153 @@
+from __future__ import annotations
+from typing import Callable, Dict, List
+from collections import OrderedDict
+import threading, time, weakref
+
+from .Model import BaseModel
+
+class ModelRegistry:
+    def __init__(self, loader: Callable[[int], BaseModel], memory_budget: int, logging: bool = True):
+        """Models loaded on first use and evicted least recently used first to stay under a memory budget
+        Models with the same hashtags or words share one vocabulary, which is only counted once.
+
+        Args:
+            loader (Callable[[int], BaseModel]): Loads a model from its ID, raises KeyError if there is no such model
+            memory_budget (int): Total memory in bytes for the loaded models (the last used model is always kept)
+            logging (bool, optional): Whether to log loads and evictions in stdout or not. Defaults to True.
+        """
+        self.loader = loader
+        self.memory_budget = memory_budget
+        self.logging = logging
+
+        self._entries = OrderedDict() # Model ID -> entry dict, least recently used first
+        self._vocabularies = weakref.WeakValueDictionary() # Fingerprint -> vocabulary of a loaded model
+        self._lock = threading.Lock()
+        self._loading = {} # Model ID -> lock held while the model loads, so it is only loaded once
+
+    def _share_vocabularies(self, model: BaseModel):
+        for name in ("_hashtags", "_words"):
+            vocabulary = getattr(model, name)
+            shared = self._vocabularies.setdefault(vocabulary.fingerprint, vocabulary)
+            setattr(model, name, shared)
+
+    def _vocabulary_nbytes(self, model: BaseModel) -> int:
+        return model._hashtags.nbytes + model._words.nbytes
+
+    @property
+    def nbytes(self) -> int:
+        """Get the memory used by the loaded models, shared vocabularies are counted once
+
+        Returns:
+            int: The size in bytes
+        """
+        nbytes = 0
+        vocabularies = {}
+        for entry in self._entries.values():
+            model = entry["model"]
+            nbytes += model.nbytes - self._vocabulary_nbytes(model)
+            vocabularies[id(model._hashtags)] = model._hashtags.nbytes
+            vocabularies[id(model._words)] = model._words.nbytes
+        return nbytes + sum(vocabularies.values())
+
+    def _evict_over_budget(self):
+        while len(self._entries) > 1 and self.nbytes > self.memory_budget:
+            model_id, _ = self._entries.popitem(last=False)
+            if self.logging: print(f"Model {model_id} evicted")
+
+    def get(self, model_id: int) -> BaseModel:
+        """Get a model, loading it if it isn't loaded
+
+        Args:
+            model_id (int): The model ID
+
+        Raises:
+            KeyError: There is no model with this ID
+
+        Returns:
+            BaseModel: The model
+        """
+        with self._lock:
+            if model_id in self._entries:
+                self._entries.move_to_end(model_id)
+                self._entries[model_id]["hits"] += 1
+                return self._entries[model_id]["model"]
+            loading = self._loading.setdefault(model_id, threading.Lock())
+
+        # Only the model being loaded waits, requests for loaded models go on
+        with loading:
+            with self._lock:
+                if model_id in self._entries:
+                    self._entries.move_to_end(model_id)
+                    self._entries[model_id]["hits"] += 1
+                    return self._entries[model_id]["model"]
+            try:
+                if self.logging: print(f"Loading model {model_id}")
+                start = time.perf_counter()
+                model = self.loader(model_id)
+                load_seconds = time.perf_counter() - start
+            except:
+                with self._lock:
+                    self._loading.pop(model_id, None)
+                raise
+
+            # Inserted in the same critical section that drops the loading lock, a request in between would load it again
+            with self._lock:
+                self._share_vocabularies(model)
+                self._entries[model_id] = {
+                    "model": model,
+                    "load_seconds": load_seconds,
+                    "loaded_at": time.time(),
+                    "hits": 1
+                }
+                self._loading.pop(model_id, None)
+                self._evict_over_budget()
+            if self.logging: print(f"Model {model_id} loaded in {load_seconds:.1f} s")
+            return model
+
+    def evict(self, model_id: int):
+        """Unload a model (does nothing if it isn't loaded)
+
+        Args:
+            model_id (int): The model ID
+        """
+        with self._lock:
+            self._entries.pop(model_id, None)
+
+    def __contains__(self, model_id: int) -> bool:
+        return model_id in self._entries
+
+    def models(self) -> List[BaseModel]:
+        """Get the loaded models
+
+        Returns:
+            List[BaseModel]: The models, least recently used first
+        """
+        with self._lock:
+            return [ entry["model"] for entry in self._entries.values() ]
+
+    def stats(self) -> List[Dict[str, float]]:
+        """Get the load time and memory of the loaded models
+
+        Returns:
+            List[Dict[str, float]]: The model ID, load time, load UNIX timestamp, hit count, memory in bytes and
+                memory shared with other models in bytes of each loaded model, least recently used first
+        """
+        with self._lock:
+            vocabulary_users = {}
+            for entry in self._entries.values():
+                for vocabulary in (entry["model"]._hashtags, entry["model"]._words):
+                    vocabulary_users[id(vocabulary)] = vocabulary_users.get(id(vocabulary), 0) + 1
+            return [
+                {
+                    "model_id": model_id,
+                    "load_seconds": entry["load_seconds"],
+                    "loaded_at": entry["loaded_at"],
+                    "hits": entry["hits"],
+                    "nbytes": entry["model"].nbytes,
+                    "shared_nbytes": sum(
+                        vocabulary.nbytes for vocabulary in (entry["model"]._hashtags, entry["model"]._words)
+                        if vocabulary_users[id(vocabulary)] > 1
+                    )
+                }
+                for model_id, entry in self._entries.items()
+            ]
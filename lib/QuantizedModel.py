@@ -0,0 +1,184 @@
+from __future__ import annotations
+from typing import List, Dict
+import numpy, time
+
+from .Model import BaseModel, Model
+from .utils import top_k
+
+_FLOAT16_MAX = float(numpy.finfo(numpy.float16).max) # Larger counts would become inf
+
+class QuantizedModel(BaseModel):
+    def __init__(self,
+        tweet_count: int,
+        hashtags: Dict[str, int],
+        hashtag_frequencies: numpy.ndarray,
+        words: Dict[str, int],
+        word_tags: numpy.ndarray,
+        scores: numpy.ndarray,
+        scales: numpy.ndarray,
+        model_id: int = None):
+        """Serving-only model with compact relations
+        The relations are stored transposed (one contiguous row of hashtag scores per word) so scoring
+        a text reads only the rows of its words. uint8 scores are scaled per hashtag so the largest count
+        of each hashtag maps to 255, non-zero counts are rounded up to at least 1 so a word seen with a hashtag
+        never loses all its weight. float16 scores are the counts themselves, scaled like uint8 only for hashtags
+        with counts above the float16 maximum (65504). float16 keeps 11 significant bits, so counts above 2048
+        are rounded and close scores can swap ranks.
+
+        Args:
+            scores (numpy.ndarray): Quantized relations with shape (word_count, hashtag_count) and dtype uint8 or float16
+            scales (numpy.ndarray): Per hashtag multiplier that turns summed scores back into counts (shape is (hashtag_count,))
+        """
+        if scores.shape != (len(words), len(hashtags)):
+            raise TypeError(f"Invalid shape {scores.shape}. Must be (word_count, hashtag_count) : {(len(words), len(hashtags))}")
+        if scores.dtype not in (numpy.uint8, numpy.float16):
+            raise TypeError(f"Invalid dtype {scores.dtype}. Must be uint8 or float16")
+        if len(scales) != len(hashtags):
+            raise TypeError(f"Scales shape ({len(scales)}) does not match hashtags shape ({len(hashtags)})")
+        super().__init__(
+            tweet_count=tweet_count,
+            hashtags=hashtags,
+            hashtag_frequencies=hashtag_frequencies,
+            words=words,
+            word_tags=word_tags,
+            model_id=model_id
+        )
+        self.scores = scores
+        self.scales = scales
+        # Summing uint8 needs a wider integer, summing float16 loses precision quickly
+        self._accumulator = numpy.uint32 if scores.dtype == numpy.uint8 else numpy.float32
+        self.nonzero_cells = None # Non-zero counts of the quantized model and how many became 0, set by from_model
+        self.zeroed_cells = None
+
+    @classmethod
+    def from_model(cls, model: Model, dtype: str = "uint8", batch_size: int = 4096) -> QuantizedModel:
+        """Quantize the relations of a model
+
+        Args:
+            model (Model): The model to quantize
+            dtype (str, optional): "uint8" or "float16". Defaults to "uint8".
+            batch_size (int, optional): Number of hashtags converted at a time. Defaults to 4096.
+
+        Returns:
+            QuantizedModel: The quantized model, it shares the vocabulary of the original model
+        """
+        dtype = numpy.dtype(dtype)
+        hashtag_count, word_count = model.relations.shape
+        scores = numpy.empty((word_count, hashtag_count), dtype=dtype)
+        scales = numpy.ones(hashtag_count, dtype=numpy.float32)
+        nonzero_cells = 0
+        zeroed_cells = 0
+
+        for low in range(0, hashtag_count, batch_size):
+            high = min(low + batch_size, hashtag_count)
+            counts = model.large_counts.dense_rows(model.relations[low:high], low)
+            maximum = counts.max(axis=1) if word_count else numpy.zeros(high - low)
+            if dtype == numpy.uint8:
+                # Hashtags whose counts all fit in a byte are kept exact
+                scales[low:high] = numpy.where(maximum > 255, maximum / 255, 1)
+                rounded = numpy.rint(counts / scales[low:high,None])
+                # Small counts of hashtags with a dominant word would round to 0
+                scores[:,low:high] = numpy.where(counts > 0, numpy.maximum(rounded, 1), 0).T
+            else:
+                scales[low:high] = numpy.where(maximum > _FLOAT16_MAX, maximum / _FLOAT16_MAX, 1)
+                scores[:,low:high] = numpy.minimum(counts / scales[low:high,None], _FLOAT16_MAX).T
+            nonzero = counts > 0
+            nonzero_cells += int(numpy.count_nonzero(nonzero))
+            zeroed_cells += int(numpy.count_nonzero(nonzero & (scores[:,low:high].T == 0)))
+
+        quantized = cls(
+            tweet_count=model.tweet_count,
+            hashtags=model._hashtags,
+            hashtag_frequencies=model.hashtag_frequencies,
+            words=model._words,
+            word_tags=model.word_tags,
+            scores=scores,
+            scales=scales,
+            model_id=model.model_id
+        )
+        quantized.cooccurrence = model.cooccurrence
+        quantized.nonzero_cells = nonzero_cells
+        quantized.zeroed_cells = zeroed_cells
+        return quantized
+
+    def _get_hashtag_words(self, hashtag: str) -> numpy.ndarray:
+        """Returns a list of (approximate) word counts for a hashtag
+
+        Args:
+            hashtag (str): The hashtag string
+
+        Returns:
+            numpy.ndarray: A numpy array with shape (len(words),)
+        """
+        hashtag_id = self._hashtags[hashtag]
+        return self.scores[:,hashtag_id] * self.scales[hashtag_id]
+
+    @property
+    def nbytes(self) -> int:
+        return super().nbytes + self.scores.nbytes + self.scales.nbytes
+
+    def word_ids_probability(self, word_ids: List[int]) -> numpy.ndarray:
+        """Predict the (relative) probabilities for each hashtag from already tokenized words
+
+        Args:
+            word_ids (List[int]): The IDs of the words in the text
+
+        Returns:
+            numpy.ndarray: List of relative probabilities with the index of the hashtag ID
+        """
+        hashtag_probabilities = numpy.zeros(len(self.scales), dtype=self._accumulator)
+        for word_id in word_ids:
+            numpy.add(hashtag_probabilities, self.scores[word_id], out=hashtag_probabilities)
+        return hashtag_probabilities * self.scales
+
+def compare_models(exact: BaseModel, approximate: BaseModel, texts: List[str], k: int = 10) -> Dict[str, float]:
+    """Measure how closely an approximate model ranks hashtags compared to an exact model
+    Both models must have the same vocabulary
+
+    Args:
+        exact (BaseModel): The reference model
+        approximate (BaseModel): The model to measure
+        texts (List[str]): The texts to score (texts with no known words are skipped)
+        k (int, optional): The number of top hashtags to compare. Defaults to 10.
+
+    Returns:
+        Dict[str, float]: The mean top-k overlap, top-1 agreement, worst score error relative to the top
+            exact score, mean scoring time of both models in milliseconds and the number of texts compared
+    """
+    overlap = 0
+    top_1 = 0
+    max_error = 0
+    exact_time = 0
+    approximate_time = 0
+    count = 0
+    for text in texts:
+        word_ids = exact.get_text_word_ids(text)
+        if not word_ids:
+            continue
+
+        start = time.perf_counter()
+        exact_scores = exact.word_ids_probability(word_ids)
+        exact_time += time.perf_counter() - start
+        start = time.perf_counter()
+        approximate_scores = approximate.word_ids_probability(word_ids)
+        approximate_time += time.perf_counter() - start
+
+        exact_top = top_k(exact_scores, k)
+        approximate_top = top_k(approximate_scores, k)
+        if len(exact_top) == 0:
+            continue
+        overlap += len(set(exact_top.tolist()) & set(approximate_top.tolist())) / len(exact_top)
+        top_1 += exact_top[0] == approximate_top[0]
+        highest = float(exact_scores[exact_top[0]])
+        if highest > 0:
+            max_error = max(max_error, float(numpy.abs(approximate_scores - exact_scores).max()) / highest)
+        count += 1
+
+    return {
+        "texts": count,
+        "top_k_overlap": overlap / count if count else 0,
+        "top_1_agreement": float(top_1) / count if count else 0,
+        "max_relative_error": max_error,
+        "exact_ms": 1000 * exact_time / count if count else 0,
+        "approximate_ms": 1000 * approximate_time / count if count else 0
+    }
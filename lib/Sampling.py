@@ -0,0 +1,215 @@
+from __future__ import annotations
+from typing import List, Dict, Tuple, Iterable
+import heapq, random, time
+
+from .Model import BaseModel
+from .utils import top_k
+
+class StratifiedReservoir:
+    def __init__(self, sample_size: int = 100000, per_hashtag: int = 3, probe_size: int = 1000, seed: int = 0, max_size: int = None):
+        """Sample of a tweet stream in one pass where every hashtag keeps some of its tweets
+        Every tweet gets a random key. The sample is the tweets with the sample_size smallest keys overall,
+        plus for every hashtag its per_hashtag tweets with the smallest keys, so rare hashtags are not
+        crowded out by common ones. On long-tail streams the hashtag tweets are capped so the sample holds
+        at most max_size tweets, the hashtag tweets with the largest keys are dropped first.
+        A separate uniform sample of probe tweets is drawn for comparisons, probes are left out of the sample.
+
+        Args:
+            sample_size (int, optional): The number of tweets in the uniform part of the sample. Defaults to 100000.
+            per_hashtag (int, optional): The number of tweets kept for every hashtag (0 for a uniform sample). Defaults to 3.
+            probe_size (int, optional): The number of probe tweets. Defaults to 1000.
+            seed (int, optional): The seed of the random keys. Defaults to 0.
+            max_size (int, optional): The largest number of sampled tweets. Defaults to 2 * sample_size.
+        """
+        self.sample_size = sample_size
+        self.per_hashtag = per_hashtag
+        self.probe_size = probe_size
+        self.max_size = max_size if max_size != None else 2 * sample_size
+        self._random = random.Random(seed)
+        self._probe_random = random.Random(seed + 1)
+
+        self.seen = 0
+        self.hashtag_frequencies = {} # Hashtag -> number of tweets seen using it
+
+        # Heaps of (-key, index) hold the smallest keys, the largest one is on top and is replaced first
+        self._uniform = []
+        self._strata = {} # Hashtag -> heap
+        self._strata_size = 0 # Tweets held in all the hashtag heaps
+        self._strata_keys = [] # Heap of (-key, index, hashtag) of the hashtag heaps' tweets, may hold dropped ones
+        self._tweets = {} # Index -> [tweet, number of heaps holding it]
+        self._probes = [] # (index, tweet)
+
+    def _offer(self, heap: List[Tuple[float,int]], capacity: int, key: float, index: int) -> bool:
+        if len(heap) < capacity:
+            heapq.heappush(heap, (-key, index))
+        elif -heap[0][0] > key:
+            _, evicted = heapq.heapreplace(heap, (-key, index))
+            self._release(evicted)
+        else:
+            return False
+        return True
+
+    def _release(self, index: int):
+        entry = self._tweets[index]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._tweets[index]
+
+    def _shrink(self):
+        # Drop the hashtag tweets with the largest keys until the sample fits in max_size
+        while len(self._tweets) > self.max_size and self._strata_keys:
+            negative_key, index, hashtag = heapq.heappop(self._strata_keys)
+            heap = self._strata.get(hashtag)
+            if heap == None or (negative_key, index) not in heap:
+                continue # Already replaced by a tweet with a smaller key
+            heap.remove((negative_key, index))
+            heapq.heapify(heap)
+            self._strata_size -= 1
+            self._release(index)
+        # Replaced tweets pile up in the key heap, it is rebuilt once they are the majority
+        if len(self._strata_keys) > 2 * self._strata_size + 1024:
+            self._strata_keys = [
+                (negative_key, index, hashtag)
+                for hashtag, heap in self._strata.items() for negative_key, index in heap
+            ]
+            heapq.heapify(self._strata_keys)
+
+    def add(self, tweet: Tuple[str,str]):
+        """Offer a tweet to the sample
+
+        Args:
+            tweet (Tuple[str,str]): The tweet (content, hashtags)
+        """
+        index = self.seen
+        self.seen += 1
+        key = self._random.random()
+
+        entry = [tweet, 0]
+        self._tweets[index] = entry
+        if self.sample_size > 0:
+            entry[1] += self._offer(self._uniform, self.sample_size, key, index)
+        for hashtag in set(tweet[1].split(",")):
+            self.hashtag_frequencies[hashtag] = self.hashtag_frequencies.get(hashtag, 0) + 1
+            if self.per_hashtag > 0:
+                heap = self._strata.setdefault(hashtag, [])
+                full = len(heap) == self.per_hashtag
+                if self._offer(heap, self.per_hashtag, key, index):
+                    entry[1] += 1
+                    self._strata_size += not full
+                    heapq.heappush(self._strata_keys, (-key, index, hashtag))
+        if entry[1] == 0:
+            del self._tweets[index]
+        self._shrink()
+
+        # Reservoir sampling (algorithm R) of the probe tweets
+        if len(self._probes) < self.probe_size:
+            self._probes.append((index, tweet))
+        else:
+            slot = self._probe_random.randrange(self.seen)
+            if slot < self.probe_size:
+                self._probes[slot] = (index, tweet)
+
+    def extend(self, tweets: Iterable[Tuple[str,str]]):
+        """Offer every tweet of a stream to the sample
+
+        Args:
+            tweets (Iterable[Tuple[str,str]]): The tweets (content, hashtags), see .utils.iterate_tweets
+        """
+        for tweet in tweets:
+            self.add(tweet)
+
+    @property
+    def sample(self) -> List[Tuple[str,str]]:
+        """Get the sampled tweets in stream order, without the probe tweets
+
+        Returns:
+            List[Tuple[str,str]]: The tweets (content, hashtags)
+        """
+        probes = { index for index, _ in self._probes }
+        return [ self._tweets[index][0] for index in sorted(self._tweets) if index not in probes ]
+
+    @property
+    def probes(self) -> List[Tuple[str,str]]:
+        return [ tweet for _, tweet in self._probes ]
+
+    def stats(self) -> Dict[str, float]:
+        """Estimate how much of the stream the sample covers
+
+        Returns:
+            Dict[str, float]: The tweets seen and sampled, the sampled fraction, the fraction of distinct hashtags with a
+                sampled tweet and the fraction of hashtag uses whose hashtag has a sampled tweet
+        """
+        sample = self.sample
+        sampled_hashtags = set()
+        for tweet in sample:
+            sampled_hashtags.update(tweet[1].split(","))
+        uses = sum(self.hashtag_frequencies.values())
+        return {
+            "tweets_seen": self.seen,
+            "tweets_sampled": len(sample),
+            "sample_fraction": len(sample) / self.seen if self.seen else 0,
+            "hashtag_coverage": len(sampled_hashtags) / len(self.hashtag_frequencies) if self.hashtag_frequencies else 0,
+            "hashtag_use_coverage": sum(
+                frequency for hashtag, frequency in self.hashtag_frequencies.items() if hashtag in sampled_hashtags
+            ) / uses if uses else 0
+        }
+
+def compare_preview(full: BaseModel, preview: BaseModel, texts: List[str], k: int = 10, persistence: float = 0.9) -> Dict[str, float]:
+    """Measure how closely a model built from a sample ranks hashtags compared to the full model
+    The models have different vocabularies so hashtags are compared by their strings
+
+    Args:
+        full (BaseModel): The reference model
+        preview (BaseModel): The model built from a sample
+        texts (List[str]): The probe texts (texts with no words known to the full model are skipped)
+        k (int, optional): The number of top hashtags to compare. Defaults to 10.
+        persistence (float, optional): The weight of each next rank in the rank-biased overlap. Defaults to 0.9.
+
+    Returns:
+        Dict[str, float]: The mean top-k overlap, top-1 agreement and rank-biased overlap of the top k, the fraction
+            of the full model's known probe words that the preview knows, mean scoring time of both models in
+            milliseconds and the number of texts compared
+    """
+    overlap = 0
+    top_1 = 0
+    rank_biased_overlap = 0
+    known_words = 0
+    preview_known_words = 0
+    full_time = 0
+    preview_time = 0
+    count = 0
+    for text in texts:
+        full_word_ids = full.get_text_word_ids(text)
+        if not full_word_ids:
+            continue
+        preview_word_ids = preview.get_text_word_ids(text)
+        known_words += len(full_word_ids)
+        preview_known_words += len(preview_word_ids)
+
+        start = time.perf_counter()
+        full_top = [ full.get_hashtag_string(hashtag_id) for hashtag_id in top_k(full.word_ids_probability(full_word_ids), k) ]
+        full_time += time.perf_counter() - start
+        start = time.perf_counter()
+        preview_top = [ preview.get_hashtag_string(hashtag_id) for hashtag_id in top_k(preview.word_ids_probability(preview_word_ids), k) ] if preview_word_ids else []
+        preview_time += time.perf_counter() - start
+        if not full_top:
+            continue
+
+        overlap += len(set(full_top) & set(preview_top)) / len(full_top)
+        top_1 += bool(preview_top) and full_top[0] == preview_top[0]
+        # Agreement of every prefix, weighted so the first ranks count the most (normalised to 1 for identical lists)
+        agreement = 0
+        for depth in range(1, len(full_top) + 1):
+            agreement += persistence ** (depth - 1) * len(set(full_top[:depth]) & set(preview_top[:depth])) / depth
+        rank_biased_overlap += agreement * (1 - persistence) / (1 - persistence ** len(full_top))
+        count += 1
+
+    return {
+        "texts": count,
+        "top_k_overlap": overlap / count if count else 0,
+        "top_1_agreement": top_1 / count if count else 0,
+        "rank_biased_overlap": rank_biased_overlap / count if count else 0,
+        "word_coverage": preview_known_words / known_words if known_words else 0,
+        "full_ms": 1000 * full_time / count if count else 0,
+        "preview_ms": 1000 * preview_time / count if count else 0
+    }
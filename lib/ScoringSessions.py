@@ -0,0 +1,120 @@
+from __future__ import annotations
+from typing import List, Dict
+from collections import OrderedDict, Counter
+import threading, time, numpy
+
+from .Model import BaseModel
+
+class ScoringSessions:
+    def __init__(self, memory_budget: int = 256 * 1024 * 1024, ttl: float = 600):
+        """Running hashtag scores of texts being edited, so an update only scores the words that changed
+        Scores are kept as float32 (4 bytes per hashtag). Sessions past the TTL or over the memory budget are
+        dropped least recently used first, on every update and whenever expire is called, a dropped session is
+        simply scored from scratch on its next update.
+
+        Args:
+            memory_budget (int, optional): Total memory in bytes for the score vectors of all sessions. Defaults to 256 MiB.
+            ttl (float, optional): Seconds after its last update that a session is dropped. Defaults to 600.
+        """
+        self.memory_budget = memory_budget
+        self.ttl = ttl
+
+        self._sessions = OrderedDict() # Session ID -> session dict, least recently used first
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    def _drop(self, session_id: str):
+        session = self._sessions.pop(session_id)
+        self._nbytes -= session["scores"].nbytes
+
+    def _expire(self, now: float):
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session["updated"] <= self.ttl and self._nbytes <= self.memory_budget:
+                break
+            self._drop(session_id)
+
+    def expire(self):
+        """Drop the sessions past the TTL (call it periodically so idle sessions don't wait for new traffic)"""
+        with self._lock:
+            self._expire(time.time())
+
+    def update(self, session_id: str, model: BaseModel, word_ids: List[int]) -> numpy.ndarray:
+        """Score the new words of a session's text
+
+        Args:
+            session_id (str): The session ID (chosen by the client)
+            model (BaseModel): The model to score with, a session moved to another model starts over
+            word_ids (List[int]): The IDs of all the words in the current text
+
+        Returns:
+            numpy.ndarray: List of relative probabilities with the index of the hashtag ID, see BaseModel.word_ids_probability (must not be modified)
+        """
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session != None and session["model"] is not model:
+                self._drop(session_id)
+                session = None
+            if session != None:
+                self._sessions.move_to_end(session_id)
+                session["updated"] = now
+            self._expire(now)
+        counts = Counter(word_ids)
+
+        if session == None:
+            session = {
+                "model": model,
+                "counts": counts,
+                "scores": model.word_ids_probability(list(counts.elements())).astype(numpy.float32),
+                "updated": now,
+                "lock": threading.Lock() # Updates of the same session are applied one at a time
+            }
+        else:
+            with session["lock"]:
+                # Only the columns of words added or removed since the last update are read
+                added = list((counts - session["counts"]).elements())
+                removed = list((session["counts"] - counts).elements())
+                if not counts:
+                    session["scores"] = numpy.zeros_like(session["scores"])
+                else:
+                    # A new array, so scores returned by earlier updates are left alone
+                    scores = session["scores"]
+                    if added:
+                        scores = scores + model.word_ids_probability(added).astype(numpy.float32)
+                    if removed:
+                        scores = scores - model.word_ids_probability(removed).astype(numpy.float32)
+                    session["scores"] = scores
+                session["counts"] = counts
+                session["updated"] = now
+            return session["scores"]
+
+        with self._lock:
+            if session_id in self._sessions:
+                self._drop(session_id)
+            self._sessions[session_id] = session
+            self._nbytes += session["scores"].nbytes
+            self._expire(now)
+        return session["scores"]
+
+    def close(self, session_id: str):
+        """End a session (does nothing if it doesn't exist)
+
+        Args:
+            session_id (str): The session ID
+        """
+        with self._lock:
+            if session_id in self._sessions:
+                self._drop(session_id)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    @property
+    def nbytes(self) -> int:
+        """Get the memory used by the score vectors of the sessions
+
+        Returns:
+            int: The size in bytes
+        """
+        return self._nbytes
@@ -0,0 +1,177 @@
+from __future__ import annotations
+from typing import List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Connection, answer_challenge, deliver_challenge
+import heapq, queue, socket, struct, threading, numpy
+
+_HANDSHAKE_TIMEOUT = 5.0 # Seconds a client gets to authenticate
+
+def _set_timeout(fileno: int, timeout: float):
+    # Connections read the file descriptor directly, so the timeout is set on the socket itself (0 for none)
+    sock = socket.socket(fileno=fileno)
+    try:
+        seconds = struct.pack("ll", int(timeout), int(timeout % 1 * 1e6))
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVTIMEO, seconds)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO, seconds)
+    finally:
+        sock.detach()
+
+from .LargeCounts import LargeCounts
+from .utils import top_k
+
+class ShardServer:
+    def __init__(self, relations: numpy.ndarray, hashtag_offset: int, address: Tuple[str, int], authkey: bytes, large_counts: LargeCounts = None):
+        """Serves top-k queries for a range of hashtags of a model
+
+        Args:
+            relations (numpy.ndarray): The relations rows of the shard
+            hashtag_offset (int): The hashtag ID of the first row
+            address (Tuple[str, int]): The (host, port) to listen on
+            authkey (bytes): Shared key clients must use to connect, requests are unpickled so it must be secret
+            large_counts (LargeCounts, optional): The large counts of the shard (hashtag IDs relative to hashtag_offset). Defaults to None.
+
+
+        Raises:
+            ValueError: The authkey is empty
+        """
+        if not authkey:
+            raise ValueError("A shard server needs a non-empty authkey, its requests are unpickled")
+        self.relations = relations
+        self.large_counts = large_counts if large_counts != None else LargeCounts.empty()
+        self.hashtag_offset = hashtag_offset
+        self.address = address
+        self.authkey = authkey
+
+    def top_k(self, word_ids: List[int], k: int) -> List[Tuple[int, int]]:
+        """Score the hashtags of the shard for some words
+
+        Args:
+            word_ids (List[int]): The IDs of the words in the text
+            k (int): The number of hashtags to return
+
+        Returns:
+            List[Tuple[int, int]]: Up to k (hashtag ID, score) sorted by highest score
+        """
+        scores = self.large_counts.add_columns(self.relations[:,word_ids].sum(axis=1), word_ids)
+        return [
+            (self.hashtag_offset + int(index), int(scores[index]))
+            for index in top_k(scores, k)
+        ]
+
+    def _handle(self, connection):
+        try:
+            # Authenticated here rather than in accept so a slow or wrong client can't hold up the others
+            _set_timeout(connection.fileno(), _HANDSHAKE_TIMEOUT)
+            deliver_challenge(connection, self.authkey)
+            answer_challenge(connection, self.authkey)
+            _set_timeout(connection.fileno(), 0)
+            while True:
+                request = connection.recv()
+                if request[0] == "top_k":
+                    connection.send(self.top_k(request[1], request[2]))
+                elif request[0] == "range":
+                    connection.send((self.hashtag_offset, self.hashtag_offset + len(self.relations)))
+                else:
+                    connection.send(None)
+        except (EOFError, OSError, AuthenticationError):
+            pass
+        finally:
+            connection.close()
+
+    def serve_forever(self):
+        """Accept connections forever, each connection is handled in its own thread"""
+        with Listener(self.address) as listener:
+            while True:
+                try:
+                    connection = listener.accept()
+                except OSError:
+                    continue
+                threading.Thread(target=self._handle, args=(connection,), daemon=True).start()
+
+class ShardClient:
+    def __init__(self, addresses: List[Tuple[str, int]], authkey: bytes, timeout: float = 5.0):
+        """Scatter-gather client for a set of shard servers
+
+        Args:
+            addresses (List[Tuple[str, int]]): The (host, port) of every shard server
+            authkey (bytes): Shared key of the shard servers
+            timeout (float, optional): Seconds to wait for a shard to connect or answer. Defaults to 5.0.
+
+        Raises:
+            ValueError: The authkey is empty
+        """
+        if not authkey:
+            raise ValueError("Shard servers need a non-empty authkey")
+        self.addresses = addresses
+        self.authkey = authkey
+        self.timeout = timeout
+        # Connections can't be shared between threads, so each shard has a pool of idle connections
+        self._connections = [ queue.SimpleQueue() for _ in addresses ]
+        self._executor = ThreadPoolExecutor(max_workers=max(4, 2 * len(addresses)))
+
+    def _connect(self, shard: int) -> Connection:
+        sock = socket.create_connection(self.addresses[shard], timeout=self.timeout)
+        sock.settimeout(None)
+        connection = Connection(sock.detach())
+        _set_timeout(connection.fileno(), self.timeout)
+        try:
+            answer_challenge(connection, self.authkey)
+            deliver_challenge(connection, self.authkey)
+        except:
+            connection.close()
+            raise
+        return connection
+
+    def _request(self, shard: int, request: tuple):
+        connection = None
+        try:
+            try:
+                connection = self._connections[shard].get_nowait()
+            except queue.Empty:
+                connection = self._connect(shard)
+            connection.send(request)
+            response = connection.recv()
+        except (BlockingIOError, TimeoutError) as error:
+            if connection != None: connection.close()
+            raise TimeoutError(f"Shard {shard} at {self.addresses[shard]} did not answer within {self.timeout} s") from error
+        except (OSError, EOFError, AuthenticationError) as error:
+            if connection != None: connection.close()
+            raise ConnectionError(f"Shard {shard} at {self.addresses[shard]} failed: {error!r}") from error
+        self._connections[shard].put(connection)
+        return response
+
+    def top_k(self, word_ids: List[int], k: int) -> List[Tuple[int, int]]:
+        """Score the hashtags of every shard concurrently and merge the results
+
+        Args:
+            word_ids (List[int]): The IDs of the words in the text
+            k (int): The number of hashtags to return
+
+        Raises:
+            TimeoutError: A shard did not answer within the timeout
+            ConnectionError: A shard could not be reached or dropped the connection
+
+        Returns:
+            List[Tuple[int, int]]: Up to k (hashtag ID, score) sorted by highest score
+        """
+        request = ("top_k", [ int(word_id) for word_id in word_ids ], k)
+        futures = [
+            self._executor.submit(self._request, shard, request)
+            for shard in range(len(self.addresses))
+        ]
+        results = [ future.result() for future in futures ]
+        return heapq.nlargest(k, (result for shard_results in results for result in shard_results), key=lambda result: result[1])
+
+def shard_range(hashtag_count: int, shard: int, shards: int) -> Tuple[int, int]:
+    """Get the hashtag ID range of a shard
+
+    Args:
+        hashtag_count (int): The number of hashtags in the model
+        shard (int): The index of the shard
+        shards (int): The number of shards
+
+    Returns:
+        Tuple[int, int]: The (first, last + 1) hashtag IDs of the shard
+    """
+    return (hashtag_count * shard // shards, hashtag_count * (shard + 1) // shards)
@@ -0,0 +1,396 @@
+from __future__ import annotations
+from typing import Tuple, Iterable
+import numpy, os, json, pickle, time
+
+from .Model import Model
+from .HashtagCooccurrence import HashtagCooccurrence
+from .LargeCounts import LargeCounts, accumulate_pairs
+from .utils import tokenize_tweet
+
+_STREAMS = ("words", "word_counts", "hashtags", "hashtag_counts") # Numerized tweets, each is a file of int32
+_PAIR_BYTES = 64 # Rough peak memory per (hashtag, word) pair while expanding and spilling a chunk
+
+def _chunk_pairs(
+    words: numpy.ndarray,
+    word_counts: numpy.ndarray,
+    hashtags: numpy.ndarray,
+    hashtag_counts: numpy.ndarray) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """Expand a chunk of numerized tweets into every (hashtag, word) pair in the same tweet
+
+    Args:
+        words (numpy.ndarray): The word IDs of all the tweets in the chunk
+        word_counts (numpy.ndarray): The number of words in each tweet
+        hashtags (numpy.ndarray): The hashtag IDs of all the tweets in the chunk
+        hashtag_counts (numpy.ndarray): The number of hashtags in each tweet
+
+    Returns:
+        Tuple[numpy.ndarray, numpy.ndarray]: The (hashtag IDs, word IDs) of the pairs
+    """
+    hashtag_tweets = numpy.repeat(numpy.arange(len(hashtag_counts)), hashtag_counts)
+    word_starts = numpy.cumsum(word_counts) - word_counts
+    repeats = word_counts[hashtag_tweets]
+    pair_hashtags = numpy.repeat(hashtags, repeats)
+    pair_starts = numpy.repeat(word_starts[hashtag_tweets], repeats)
+    group_starts = numpy.repeat(numpy.cumsum(repeats) - repeats, repeats)
+    pair_words = words[pair_starts + numpy.arange(len(pair_hashtags)) - group_starts]
+    return pair_hashtags, pair_words
+
+class ShardedBuilder:
+    def __init__(self,
+        directory: str,
+        memory_budget: int = 1 << 30,
+        checkpoint_interval: int = 100000,
+        logging: bool = True):
+        """Out-of-core model builder
+        Tweets are numerized to disk and their (hashtag, word) pairs are spilled to one file per hashtag shard in a
+        single pass, then every shard is counted once into a disk-backed array. Progress is checkpointed in the
+        directory so a build can be resumed.
+
+        Args:
+            directory (str): The directory for the intermediate files and the final relations array
+            memory_budget (int, optional): Rough peak memory in bytes used for counting relations. Defaults to 1 GiB.
+            checkpoint_interval (int, optional): Number of tweets between checkpoints while tokenizing. Defaults to 100000.
+            logging (bool, optional): Whether to log progress in stdout or not. Defaults to True.
+        """
+        self.directory = directory
+        self.memory_budget = memory_budget
+        self.checkpoint_interval = checkpoint_interval
+        self.logging = logging
+
+        os.makedirs(directory, exist_ok=True)
+        self.checkpoint = self._load_checkpoint()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _load_checkpoint(self) -> dict:
+        try:
+            with open(self._path("checkpoint.json")) as file:
+                checkpoint = json.load(file)
+        except FileNotFoundError:
+            checkpoint = {
+                "stage": "tokenizing",
+                "tweets_done": 0,
+                "stream_sizes": { name: 0 for name in _STREAMS },
+                "shard_rows": None,
+                "shards_done": []
+            }
+        # Checkpoints from before the vocabulary journals and pair spilling
+        checkpoint.setdefault("journal_sizes", None)
+        checkpoint.setdefault("spilled_tweets", 0)
+        checkpoint.setdefault("spill_sizes", None)
+        return checkpoint
+
+    def _save_checkpoint(self):
+        # Written to a temporary file first so a crash can't leave a half written checkpoint
+        path = self._path("checkpoint.json")
+        with open(path + ".tmp", "w") as file:
+            json.dump(self.checkpoint, file)
+        os.replace(path + ".tmp", path)
+
+    def _load_vocabulary(self) -> dict:
+        try:
+            with open(self._path("vocabulary.pickle"), "rb") as file:
+                return pickle.load(file)
+        except FileNotFoundError:
+            return {
+                "tweet_count": 0,
+                "hashtags": {},
+                "hashtag_frequencies": [],
+                "words": {},
+                "word_tags": []
+            }
+
+    def _save_vocabulary(self, vocabulary: dict):
+        path = self._path("vocabulary.pickle")
+        with open(path + ".tmp", "wb") as file:
+            pickle.dump(vocabulary, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+
+    def _open_journals(self) -> dict:
+        """Open the vocabulary journals, new words and hashtags are appended to them while tokenizing
+        so a checkpoint only writes what is new instead of the whole vocabulary
+
+        Returns:
+            dict: The vocabulary at the last checkpoint, with the open journal files under "journals"
+        """
+        if self.checkpoint["journal_sizes"] == None:
+            # Started before journals were kept, the vocabulary at the last checkpoint is in the pickle
+            vocabulary = self._load_vocabulary()
+            with open(self._path("words.jsonl"), "w", encoding="utf-8") as file:
+                for word, tag in zip(vocabulary["words"], vocabulary["word_tags"]):
+                    file.write(json.dumps([word, tag]) + "\n")
+            with open(self._path("hashtags.jsonl"), "w", encoding="utf-8") as file:
+                for hashtag in vocabulary["hashtags"]:
+                    file.write(json.dumps(hashtag) + "\n")
+            self.checkpoint["journal_sizes"] = {
+                name: os.path.getsize(self._path(name + ".jsonl")) for name in ("words", "hashtags")
+            }
+            self._save_checkpoint()
+
+        # Anything written after the last checkpoint is thrown away and redone
+        journals = {}
+        for name in ("words", "hashtags"):
+            journals[name] = open(self._path(name + ".jsonl"), "ab")
+            journals[name].truncate(self.checkpoint["journal_sizes"][name])
+        words = {}
+        word_tags = []
+        with open(self._path("words.jsonl"), "rb") as file:
+            for line in file:
+                word, tag = json.loads(line)
+                words[word] = len(words)
+                word_tags.append(tag)
+        hashtags = {}
+        with open(self._path("hashtags.jsonl"), "rb") as file:
+            for line in file:
+                hashtags[json.loads(line)] = len(hashtags)
+        return {
+            "tweet_count": self.checkpoint["tweets_done"],
+            "hashtags": hashtags,
+            "hashtag_frequencies": numpy.bincount(self._read_stream("hashtags"), minlength=len(hashtags)).tolist(),
+            "words": words,
+            "word_tags": word_tags,
+            "journals": journals
+        }
+
+    def _tokenize(self, tweets: Iterable[Tuple[str,str]]):
+        vocabulary = self._open_journals()
+        journals = vocabulary.pop("journals")
+        words = vocabulary["words"]
+        word_tags = vocabulary["word_tags"]
+        hashtags = vocabulary["hashtags"]
+        hashtag_frequencies = vocabulary["hashtag_frequencies"]
+
+        # Anything written after the last checkpoint is thrown away and redone
+        streams = {}
+        for name in _STREAMS:
+            streams[name] = open(self._path(name + ".bin"), "ab")
+            streams[name].truncate(self.checkpoint["stream_sizes"][name])
+        buffers = { name: [] for name in _STREAMS }
+        new_entries = { "words": [], "hashtags": [] } # Journal lines since the last checkpoint
+
+        def _checkpoint(tweets_done: int):
+            for name in _STREAMS:
+                streams[name].write(numpy.array(buffers[name], dtype=numpy.int32).tobytes())
+                streams[name].flush()
+                os.fsync(streams[name].fileno())
+                buffers[name].clear()
+                self.checkpoint["stream_sizes"][name] = streams[name].tell()
+            for name, journal in journals.items():
+                journal.write("".join(new_entries[name]).encode("utf-8"))
+                journal.flush()
+                os.fsync(journal.fileno())
+                new_entries[name].clear()
+                self.checkpoint["journal_sizes"][name] = journal.tell()
+            self.checkpoint["tweets_done"] = tweets_done
+            self._save_checkpoint()
+
+        start = time.time()
+        skip = self.checkpoint["tweets_done"]
+        if self.logging: print(f"Tokenizing tweets (resuming after {skip})" if skip else "Tokenizing tweets")
+        tweets_done = skip
+        for index, tweet in enumerate(tweets):
+            if index < skip:
+                continue
+            tweet_words, tweet_tags = tokenize_tweet(tweet[0].lower())
+            for word, tag in zip(tweet_words, tweet_tags):
+                try:
+                    buffers["words"].append(words[word])
+                except KeyError:
+                    words[word] = len(words)
+                    word_tags.append(tag)
+                    new_entries["words"].append(json.dumps([word, tag]) + "\n")
+                    buffers["words"].append(words[word])
+            buffers["word_counts"].append(len(tweet_words))
+
+            tweet_hashtags = tweet[1].split(",")
+            for hashtag in tweet_hashtags:
+                try:
+                    hashtag_frequencies[hashtags[hashtag]] += 1
+                except KeyError:
+                    hashtags[hashtag] = len(hashtags)
+                    hashtag_frequencies.append(1)
+                    new_entries["hashtags"].append(json.dumps(hashtag) + "\n")
+                buffers["hashtags"].append(hashtags[hashtag])
+            buffers["hashtag_counts"].append(len(tweet_hashtags))
+
+            tweets_done = index + 1
+            if tweets_done % self.checkpoint_interval == 0:
+                _checkpoint(tweets_done)
+                if self.logging: print(f"{tweets_done} tweets tokenized")
+        _checkpoint(tweets_done)
+
+        for file in (*streams.values(), *journals.values()):
+            file.close()
+        # The vocabulary is only pickled once, when it is complete
+        vocabulary["tweet_count"] = tweets_done
+        self._save_vocabulary(vocabulary)
+        self.checkpoint["stage"] = "counting"
+        self._save_checkpoint()
+        if self.logging: print(time.time()-start)
+
+    def _read_stream(self, name: str) -> numpy.ndarray:
+        if self.checkpoint["stream_sizes"][name] == 0:
+            return numpy.zeros(0, dtype=numpy.int32)
+        # Only up to the last checkpoint, an interrupted run can have written more
+        return numpy.memmap(self._path(name + ".bin"), dtype=numpy.int32, mode="r")[:self.checkpoint["stream_sizes"][name] // 4]
+
+    def _spill(self, shard_rows: int, shard_count: int, max_pairs: int):
+        """Expand the tweets into (hashtag, word) pairs in one pass, appending the pairs of every shard to its own file"""
+        words = self._read_stream("words")
+        word_counts = self._read_stream("word_counts")
+        hashtags = self._read_stream("hashtags")
+        hashtag_counts = self._read_stream("hashtag_counts")
+
+        if self.checkpoint["spill_sizes"] == None:
+            self.checkpoint["spill_sizes"] = [0] * shard_count
+            self._save_checkpoint()
+        spill_sizes = self.checkpoint["spill_sizes"]
+        # Anything written after the last checkpoint is thrown away and redone
+        for shard in range(shard_count):
+            with open(self._path(f"pairs_{shard}.bin"), "ab") as file:
+                file.truncate(spill_sizes[shard])
+        done = numpy.zeros(shard_count, dtype=bool)
+        done[self.checkpoint["shards_done"]] = True
+
+        tweet_index = self.checkpoint["spilled_tweets"]
+        word_offset = int(word_counts[:tweet_index].sum(dtype=numpy.int64))
+        hashtag_offset = int(hashtag_counts[:tweet_index].sum(dtype=numpy.int64))
+        if self.logging and tweet_index < len(word_counts): print(f"Spilling pairs (resuming after {tweet_index} tweets)" if tweet_index else "Spilling pairs")
+        while tweet_index < len(word_counts):
+            # Take as many tweets as fit in the pair budget (at least one)
+            window_words = word_counts[tweet_index:tweet_index+65536].astype(numpy.int64)
+            window_hashtags = hashtag_counts[tweet_index:tweet_index+65536].astype(numpy.int64)
+            chunk_size = max(1, int(numpy.searchsorted(numpy.cumsum(window_words * window_hashtags), max_pairs, side="right")))
+            chunk_words = window_words[:chunk_size]
+            chunk_hashtags = window_hashtags[:chunk_size]
+            chunk_word_total = int(chunk_words.sum())
+            chunk_hashtag_total = int(chunk_hashtags.sum())
+
+            pair_hashtags, pair_words = _chunk_pairs(
+                numpy.asarray(words[word_offset:word_offset+chunk_word_total]),
+                chunk_words,
+                numpy.asarray(hashtags[hashtag_offset:hashtag_offset+chunk_hashtag_total]),
+                chunk_hashtags
+            )
+            shards = pair_hashtags // shard_rows
+            order = numpy.argsort(shards, kind="stable")
+            pairs = numpy.stack((pair_hashtags[order], pair_words[order]), axis=1).astype(numpy.int32)
+            bounds = numpy.searchsorted(shards[order], numpy.arange(shard_count + 1))
+            for shard in numpy.flatnonzero(numpy.diff(bounds)).tolist():
+                if done[shard]:
+                    continue
+                with open(self._path(f"pairs_{shard}.bin"), "ab") as file:
+                    file.write(pairs[bounds[shard]:bounds[shard+1]].tobytes())
+                    file.flush()
+                    os.fsync(file.fileno())
+                    spill_sizes[shard] = file.tell()
+
+            tweet_index += chunk_size
+            word_offset += chunk_word_total
+            hashtag_offset += chunk_hashtag_total
+            self.checkpoint["spilled_tweets"] = tweet_index
+            self._save_checkpoint()
+
+    def _count(self, hashtag_count: int, word_count: int) -> numpy.ndarray:
+        # Half the budget holds the shard, the other half the pairs being counted
+        if self.checkpoint["shard_rows"] == None:
+            self.checkpoint["shard_rows"] = max(1, (self.memory_budget // 2) // (word_count * numpy.dtype(numpy.int16).itemsize))
+            self._save_checkpoint()
+        shard_rows = self.checkpoint["shard_rows"]
+        max_pairs = max(1, (self.memory_budget // 2) // _PAIR_BYTES)
+        shard_count = (hashtag_count + shard_rows - 1) // shard_rows
+
+        start = time.time()
+        self._spill(shard_rows, shard_count, max_pairs)
+
+        relations_path = self._path("relations.npy")
+        relations = numpy.lib.format.open_memmap(
+            relations_path,
+            mode="r+" if os.path.exists(relations_path) else "w+",
+            dtype=numpy.int16,
+            shape=(hashtag_count, word_count)
+        )
+
+        for shard in range(shard_count):
+            if shard in self.checkpoint["shards_done"]:
+                continue
+            if self.logging: print(f"Counting shard {shard+1}/{shard_count}")
+            low = shard * shard_rows
+            high = min(low + shard_rows, hashtag_count)
+            shard_relations = numpy.zeros((high - low, word_count), dtype=numpy.int16)
+            excess = {} # Counts past what int16 cells can hold
+
+            pairs_path = self._path(f"pairs_{shard}.bin")
+            if self.checkpoint["spill_sizes"][shard] > 0:
+                pairs = numpy.memmap(pairs_path, dtype=numpy.int32, mode="r").reshape(-1, 2)
+                for pair_low in range(0, len(pairs), max_pairs):
+                    chunk = numpy.asarray(pairs[pair_low:pair_low+max_pairs])
+                    accumulate_pairs(shard_relations, chunk[:,0], chunk[:,1], excess, low)
+                del pairs
+
+            relations[low:high] = shard_relations
+            relations.flush()
+            del shard_relations
+            large_counts = LargeCounts.from_excess(excess, word_count)
+            numpy.save(self._path(f"large_{shard}.npy"), numpy.stack((large_counts.hashtag_ids, large_counts.word_ids, large_counts.excess)))
+            self.checkpoint["shards_done"].append(shard)
+            self._save_checkpoint()
+            os.remove(pairs_path) # Counted, the disk space is given back
+        del relations
+        if self.logging: print(time.time()-start)
+
+        self.checkpoint["stage"] = "done"
+        self._save_checkpoint()
+
+    def build(self, tweets: Iterable[Tuple[str,str]]) -> Model:
+        """Build (or resume building) a model from tweets
+        A resumed build must be given the same tweets in the same order
+
+        Args:
+            tweets (Iterable[Tuple[str,str]]): The tweets (content, hashtags) to use, see utils.iterate_tweets
+
+        Returns:
+            Model: The model object, its relations are a read-only array mapped from the directory
+        """
+        if self.checkpoint["stage"] == "tokenizing":
+            self._tokenize(tweets)
+
+        vocabulary = self._load_vocabulary()
+        hashtag_count = len(vocabulary["hashtags"])
+        word_count = len(vocabulary["words"])
+
+        large_counts = LargeCounts.empty()
+        if hashtag_count == 0 or word_count == 0:
+            relations = numpy.zeros((hashtag_count, word_count), dtype=numpy.int16)
+        else:
+            if self.checkpoint["stage"] == "counting":
+                self._count(hashtag_count, word_count)
+            relations = numpy.load(self._path("relations.npy"), mmap_mode="r")
+            large_counts = LargeCounts.concatenate([
+                LargeCounts(*numpy.load(self._path(f"large_{shard}.npy")))
+                for shard in sorted(self.checkpoint["shards_done"])
+                if os.path.exists(self._path(f"large_{shard}.npy")) # Shards counted before large counts were kept have none
+            ])
+
+        # Hashtag pairs are far fewer than (hashtag, word) pairs, they are counted from the streams in one pass
+        if self.logging: print("Counting co-occurrences")
+        hashtag_frequencies = numpy.array(vocabulary["hashtag_frequencies"], dtype=numpy.int32)
+        cooccurrence = HashtagCooccurrence.from_tweets(
+            self._read_stream("hashtags"),
+            self._read_stream("hashtag_counts"),
+            hashtag_frequencies
+        )
+
+        if self.logging: print("Model built!")
+        model = Model(
+            tweet_count=vocabulary["tweet_count"],
+            hashtags=vocabulary["hashtags"],
+            hashtag_frequencies=hashtag_frequencies,
+            words=vocabulary["words"],
+            word_tags=numpy.array(vocabulary["word_tags"], dtype=numpy.int16),
+            relations=relations,
+            large_counts=large_counts
+        )
+        model.cooccurrence = cooccurrence
+        return model
@@ -0,0 +1,184 @@
+from __future__ import annotations
+from typing import List, Iterator
+import numpy, os, zlib, hashlib
+
+class Vocabulary:
+    def __init__(self, buffer: numpy.ndarray, offsets: numpy.ndarray, table: numpy.ndarray):
+        """Compact string <-> ID mapping
+        Every string is stored once in a single UTF-8 buffer, string i is buffer[offsets[i]:offsets[i+1]].
+        String -> ID lookups use an open addressing hash table (crc32, linear probing) of IDs, so no
+        Python strings or dicts are kept per entry. Behaves like the Dict[str, int] it replaces.
+
+        Args:
+            buffer (numpy.ndarray): The UTF-8 bytes of all the strings (dtype is uint8)
+            offsets (numpy.ndarray): The start of each string in the buffer followed by the end of the last one (shape is (n+1,))
+            table (numpy.ndarray): The hash table of IDs, -1 for empty slots (length is a power of 2 larger than n)
+        """
+        if len(table) < len(offsets) or len(table) & (len(table) - 1):
+            raise TypeError(f"Table length ({len(table)}) must be a power of 2 larger than the string count ({len(offsets) - 1})")
+        self._buffer = buffer
+        self._offsets = offsets
+        self._table = table
+        self._mask = len(table) - 1
+        # Indexing memoryviews gives plain ints and bytes, which is several times faster than numpy scalars
+        self._buffer_view = memoryview(numpy.ascontiguousarray(buffer))
+        self._offsets_view = memoryview(numpy.ascontiguousarray(offsets))
+        self._table_view = memoryview(numpy.ascontiguousarray(table))
+        self.strings = VocabularyStrings(self)
+        self._fingerprint = None
+
+    @classmethod
+    def from_strings(cls, strings: List[str]) -> Vocabulary:
+        """Create a vocabulary from unique strings, the ID of a string is its index
+
+        Args:
+            strings (List[str]): The strings
+
+        Returns:
+            Vocabulary: The vocabulary
+        """
+        encoded = [ string.encode() for string in strings ]
+        offsets = numpy.zeros(len(encoded) + 1, dtype=numpy.int64)
+        numpy.cumsum([ len(string) for string in encoded ], out=offsets[1:])
+        buffer = numpy.frombuffer(b"".join(encoded), dtype=numpy.uint8)
+
+        # At most half full so probe sequences stay short
+        size = 1 << max(1, (2 * len(encoded)).bit_length())
+        table = numpy.full(size, -1, dtype=numpy.int32)
+        pending = numpy.arange(len(encoded), dtype=numpy.int64)
+        slots = numpy.array([ zlib.crc32(string) for string in encoded ], dtype=numpy.int64) & (size - 1)
+        # Linear probing done for all strings at once: each round the first string wanting a free slot
+        # takes it, the rest move one slot on. A string only passes slots that are already taken.
+        while len(pending):
+            free = numpy.flatnonzero(table[slots] == -1)
+            taken_slots, first = numpy.unique(slots[free], return_index=True)
+            table[taken_slots] = pending[free[first]]
+            placed = numpy.zeros(len(pending), dtype=bool)
+            placed[free[first]] = True
+            pending = pending[~placed]
+            slots = (slots[~placed] + 1) & (size - 1)
+        return cls(buffer, offsets, table)
+
+    def _bytes(self, string_id: int) -> bytes:
+        return self._buffer_view[self._offsets_view[string_id]:self._offsets_view[string_id+1]].tobytes()
+
+    def string(self, string_id: int) -> str:
+        """Get a string from its ID
+
+        Args:
+            string_id (int): The ID
+
+        Returns:
+            str: The string
+        """
+        if string_id < 0 or string_id >= len(self):
+            raise IndexError(f"Vocabulary ID {string_id} out of range")
+        return self._bytes(string_id).decode()
+
+    def __getitem__(self, string: str) -> int:
+        target = string.encode()
+        slot = zlib.crc32(target) & self._mask
+        while True:
+            string_id = self._table_view[slot]
+            if string_id == -1:
+                raise KeyError(string)
+            if self._bytes(string_id) == target:
+                return string_id
+            slot = (slot + 1) & self._mask
+
+    def get(self, string: str, default: int = None) -> int:
+        try:
+            return self[string]
+        except KeyError:
+            return default
+
+    def __contains__(self, string: str) -> bool:
+        return self.get(string) != None
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.strings)
+
+    def keys(self) -> Iterator[str]:
+        return iter(self.strings)
+
+    @property
+    def buffer(self) -> numpy.ndarray:
+        return self._buffer
+
+    @property
+    def offsets(self) -> numpy.ndarray:
+        return self._offsets
+
+    @property
+    def nbytes(self) -> int:
+        """Get the memory used by the vocabulary arrays
+
+        Returns:
+            int: The size in bytes
+        """
+        return self._buffer.nbytes + self._offsets.nbytes + self._table.nbytes
+
+    @property
+    def fingerprint(self) -> str:
+        """Get a hash of the strings and their IDs, equal vocabularies have equal fingerprints
+
+        Returns:
+            str: The hex digest
+        """
+        if self._fingerprint == None:
+            digest = hashlib.blake2b(digest_size=16)
+            digest.update(self._offsets_view)
+            digest.update(self._buffer_view)
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    def save(self, directory: str):
+        """Save the vocabulary arrays to a directory
+
+        Args:
+            directory (str): The directory to save to (created if it doesn't exist)
+        """
+        os.makedirs(directory, exist_ok=True)
+        numpy.save(os.path.join(directory, "buffer.npy"), self._buffer)
+        numpy.save(os.path.join(directory, "offsets.npy"), self._offsets)
+        numpy.save(os.path.join(directory, "table.npy"), self._table)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> Vocabulary:
+        """Load vocabulary arrays saved with Vocabulary.save
+
+        Args:
+            directory (str): The directory to load from
+            mmap (bool, optional): Whether to map the files instead of reading them, so processes share the pages. Defaults to True.
+
+        Returns:
+            Vocabulary: The vocabulary
+        """
+        mmap_mode = "r" if mmap else None
+        return cls(
+            numpy.load(os.path.join(directory, "buffer.npy"), mmap_mode=mmap_mode),
+            numpy.load(os.path.join(directory, "offsets.npy"), mmap_mode=mmap_mode),
+            numpy.load(os.path.join(directory, "table.npy"), mmap_mode=mmap_mode)
+        )
+
+class VocabularyStrings:
+    def __init__(self, vocabulary: Vocabulary):
+        """ID -> string view of a vocabulary, behaves like the List[str] it replaces"""
+        self._vocabulary = vocabulary
+
+    @property
+    def vocabulary(self) -> Vocabulary:
+        return self._vocabulary
+
+    def __getitem__(self, string_id: int) -> str:
+        return self._vocabulary.string(int(string_id))
+
+    def __len__(self) -> int:
+        return len(self._vocabulary)
+
+    def __iter__(self) -> Iterator[str]:
+        for string_id in range(len(self._vocabulary)):
+            yield self._vocabulary._bytes(string_id).decode()
@@ -1,2 +1,16 @@
-from .Model import Model
+from .Model import BaseModel, Model
+from .Vocabulary import Vocabulary
+from .QuantizedModel import QuantizedModel, compare_models
+from .ShardedBuilder import ShardedBuilder
+from .Evaluation import evaluate, split_tweets
+from .Sampling import StratifiedReservoir, compare_preview
+from .HashtagPriors import HashtagPriors
+from .HashtagIndex import HashtagIndex
+from .HashtagCooccurrence import HashtagCooccurrence
+from .LargeCounts import LargeCounts, COUNT_LIMIT
+from .ModelRegistry import ModelRegistry
+from .ScoringSessions import ScoringSessions
+from .ShardServer import ShardServer, ShardClient, shard_range
+from .Deduplicator import Deduplicator, MinHasher, deduplicate_tweets
+from .ingest import extract_tweet, iterate_archive, ingest_archives
 from .utils import *
\ No newline at end of file
@@ -0,0 +1,141 @@
+from typing import Tuple
+import numpy, struct, zlib, lzma
+
+# Sparse relations rows are stored as
+#   magic (4 bytes) | version (1 byte) | codec (1 byte) | nonzero count (uint32) | payload length (uint32) | payload
+# where the uncompressed payload is the word ID deltas (uint32) followed by the counts.
+# Version 2 rows also hold counts that don't fit the counts dtype (see .LargeCounts), after the counts come
+#   large count (uint32) | large word ID deltas (uint32) | excess counts (int64)
+# Rows without large counts are still written as version 1.
+# Rows saved before this format are the raw int16 array, those are recognised by their length.
+SPARSE_MAGIC = b"THAS"
+SPARSE_VERSION = 1
+LARGE_VERSION = 2
+_HEADER = struct.Struct("<4sBBII")
+
+CODECS = {
+    "none": 0,
+    "zlib": 1,
+    "lzma": 2
+}
+
+def _compress(data: bytes, codec: int) -> bytes:
+    if codec == CODECS["zlib"]:
+        return zlib.compress(data, 6)
+    if codec == CODECS["lzma"]:
+        return lzma.compress(data, preset=6)
+    return data
+
+def _decompress(data: bytes, codec: int) -> bytes:
+    if codec == CODECS["zlib"]:
+        return zlib.decompress(data)
+    if codec == CODECS["lzma"]:
+        return lzma.decompress(data)
+    if codec == CODECS["none"]:
+        return data
+    raise ValueError(f"Unknown relations codec {codec}")
+
+def encode_sparse_row(
+    ids: numpy.ndarray,
+    counts: numpy.ndarray,
+    codec: str = "zlib",
+    large: Tuple[numpy.ndarray, numpy.ndarray] = None) -> bytes:
+    """Encode the nonzero entries of a row in the sparse format
+
+    Args:
+        ids (numpy.ndarray): The sorted column IDs of the nonzero entries
+        counts (numpy.ndarray): The counts of the nonzero entries, stored with their dtype
+        codec (str, optional): The compression of the payload ("none", "zlib" or "lzma"). Defaults to "zlib".
+        large (Tuple[numpy.ndarray, numpy.ndarray], optional): The (sorted column IDs, excess counts) of entries that don't fit the counts dtype. Defaults to None.
+
+    Returns:
+        bytes: The encoded row
+    """
+    data = numpy.diff(ids, prepend=0).astype(numpy.uint32).tobytes() + counts.tobytes()
+    version = SPARSE_VERSION
+    if large != None and len(large[0]):
+        version = LARGE_VERSION
+        data += struct.pack("<I", len(large[0]))
+        data += numpy.diff(large[0], prepend=0).astype(numpy.uint32).tobytes()
+        data += numpy.asarray(large[1], dtype=numpy.int64).tobytes()
+    payload = _compress(data, CODECS[codec])
+    return _HEADER.pack(SPARSE_MAGIC, version, CODECS[codec], len(ids), len(payload)) + payload
+
+def decode_sparse_row(blob: bytes, dtype: numpy.dtype) -> Tuple[numpy.ndarray, numpy.ndarray, Tuple[numpy.ndarray, numpy.ndarray]]:
+    """Decode a row in the sparse format
+
+    Args:
+        blob (bytes): The encoded row
+        dtype (numpy.dtype): The dtype the counts were stored with
+
+    Raises:
+        ValueError: The blob is not a valid sparse row
+
+    Returns:
+        Tuple[numpy.ndarray, numpy.ndarray, Tuple[numpy.ndarray, numpy.ndarray]]: The (column IDs, counts) of the nonzero
+            entries and the (column IDs, excess counts) of the large entries (empty for version 1 rows)
+    """
+    if len(blob) < _HEADER.size:
+        raise ValueError(f"Sparse row of {len(blob)} bytes is too short")
+    magic, version, codec, nonzero, payload_length = _HEADER.unpack_from(blob)
+    if magic != SPARSE_MAGIC:
+        raise ValueError(f"Row of {len(blob)} bytes is not in the sparse format")
+    if version not in (SPARSE_VERSION, LARGE_VERSION):
+        raise ValueError(f"Unsupported sparse row version {version}")
+    payload = _decompress(bytes(blob[_HEADER.size:_HEADER.size+payload_length]), codec)
+    ids = numpy.cumsum(numpy.frombuffer(payload, dtype=numpy.uint32, count=nonzero), dtype=numpy.int64)
+    dtype = numpy.dtype(dtype)
+    counts = numpy.frombuffer(payload, dtype=dtype, count=nonzero, offset=4*nonzero)
+
+    large_ids = numpy.zeros(0, dtype=numpy.int64)
+    large_excess = numpy.zeros(0, dtype=numpy.int64)
+    if version == LARGE_VERSION:
+        offset = (4 + dtype.itemsize) * nonzero
+        large_count, = struct.unpack_from("<I", payload, offset)
+        large_ids = numpy.cumsum(numpy.frombuffer(payload, dtype=numpy.uint32, count=large_count, offset=offset+4), dtype=numpy.int64)
+        large_excess = numpy.frombuffer(payload, dtype=numpy.int64, count=large_count, offset=offset+4+4*large_count)
+    return ids, counts, (large_ids, large_excess)
+
+def encode_relations_row(row: numpy.ndarray, codec: str = "zlib", large: Tuple[numpy.ndarray, numpy.ndarray] = None) -> bytes:
+    """Encode a relations row as a blob for the database
+
+    Args:
+        row (numpy.ndarray): The word counts of a hashtag (shape is (word_count,))
+        codec (str, optional): "dense" for the old raw format, otherwise the compression of the sparse format ("none", "zlib" or "lzma"). Defaults to "zlib".
+        large (Tuple[numpy.ndarray, numpy.ndarray], optional): The (sorted word IDs, excess counts) of the hashtag's large counts, see .LargeCounts. Defaults to None.
+
+    Returns:
+        bytes: The encoded row
+    """
+    if codec == "dense":
+        if large == None or not len(large[0]):
+            return row.tobytes()
+        codec = "zlib" # The dense format can't hold large counts
+    word_ids = numpy.flatnonzero(row)
+    blob = encode_sparse_row(word_ids, row[word_ids], codec, large)
+    if len(blob) == row.nbytes:
+        blob += b"\0" # Same length as a dense row would be read as one, the payload length makes padding safe
+    return blob
+
+def decode_relations_row(blob: bytes, row: numpy.ndarray) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """Add an encoded relations row (sparse or old dense format) to a row of the in-memory matrix
+
+    Args:
+        blob (bytes): The encoded row
+        row (numpy.ndarray): The row to add the word counts to (shape is (word_count,))
+
+    Raises:
+        ValueError: The blob is not a valid relations row
+
+    Returns:
+        Tuple[numpy.ndarray, numpy.ndarray]: The (word IDs, excess counts) of the row's large counts, see .LargeCounts
+    """
+    if len(blob) == row.nbytes:
+        row += numpy.frombuffer(blob, dtype=row.dtype)
+        return numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int64)
+    try:
+        word_ids, counts, large = decode_sparse_row(blob, row.dtype)
+    except ValueError as error:
+        raise ValueError(f"Invalid relations row for {len(row)} words: {error}")
+    row[word_ids] += counts
+    return large
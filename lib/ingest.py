@@ -0,0 +1,234 @@
+from __future__ import annotations
+from typing import List, Tuple, Dict, Iterator, Union
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+import codecs, gzip, json, os, time
+import mysql.connector
+
+from .Deduplicator import Deduplicator
+
+def extract_tweet(data: dict) -> Tuple[int, str, List[str], bool]:
+    """Get the text and hashtags of a tweet object from the Twitter API
+    Retweets are collapsed into the original tweet and truncated tweets use their extended text
+
+    Args:
+        data (dict): The tweet JSON (from the stream or the REST API, in compat or extended mode, or a {"tweet": {...}} record of a Twitter archive)
+
+    Returns:
+        Tuple[int, str, List[str], bool]: The tweet ID, text, hashtags and whether it was a retweet, None if it isn't a tweet (e.g. a delete notice)
+    """
+    if len(data) == 1 and isinstance(data.get("tweet"), dict):
+        data = data["tweet"] # Twitter's own archives wrap every tweet
+    retweet = "retweeted_status" in data
+    if retweet:
+        data = data["retweeted_status"]
+    if "id" not in data or ("text" not in data and "full_text" not in data):
+        return None
+
+    text = data.get("full_text", data.get("text"))
+    entities = data.get("entities", {})
+
+    if data.get("truncated") and "extended_tweet" in data:
+        text = data["extended_tweet"]["full_text"]
+        entities = data["extended_tweet"]["entities"]
+
+    return data["id"], text, [ hashtag["text"] for hashtag in entities.get("hashtags", []) ], retweet
+
+def _parse_lines(lines: List[bytes]) -> Tuple[List[Tuple[int,str,str]], int, int]:
+    """Parse a chunk of JSONL lines in a worker process
+
+    Returns:
+        Tuple[List[Tuple[int,str,str]], int, int]: The tweets with hashtags (id, content, hashtags), the number of retweets collapsed and the number of records skipped
+    """
+    records = []
+    for line in lines:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            records.append(None) # Blank or broken lines are counted as skipped
+    return _extract_records(records)
+
+def _extract_records(records: List[dict]) -> Tuple[List[Tuple[int,str,str]], int, int]:
+    tweets = []
+    retweets = 0
+    skipped = 0
+    for record in records:
+        tweet = extract_tweet(record) if isinstance(record, dict) else None
+        if tweet == None:
+            skipped += 1
+            continue
+        tweet_id, text, hashtags, retweet = tweet
+        retweets += retweet
+        if not hashtags:
+            skipped += 1
+            continue
+        tweets.append((tweet_id, text, ",".join(hashtags)))
+    return tweets, retweets, skipped
+
+def _open_archive(path: str):
+    with open(path, "rb") as file:
+        gzipped = file.read(2) == b"\x1f\x8b"
+    return gzip.open(path, "rb") if gzipped else open(path, "rb")
+
+def _iterate_json_array(file, read_size: int = 1 << 20) -> Iterator[dict]:
+    """Stream the objects of a JSON array without reading the whole file
+
+    Raises:
+        ValueError: An element of the array is malformed
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    # Twitter's own archives wrap the array in a JavaScript assignment ("window.YTD.tweet.part0 = [")
+    text = ""
+    while "[" not in text:
+        data = file.read(read_size)
+        if not data:
+            raise ValueError("Archive is neither JSONL nor a JSON array")
+        text = text_decoder.decode(data)
+    position = text.index("[") + 1
+    consumed = 0 # Characters dropped from the front of text
+    failed_at = None # Where decoding last failed, a failure that stays put after more data is a malformed element
+    end_of_file = False
+    while True:
+        while position < len(text) and text[position] in " \t\r\n,":
+            position += 1
+        if position < len(text) and text[position] == "]":
+            return
+        try:
+            if position == len(text):
+                raise json.JSONDecodeError("Need more data", text, position)
+            record, position = decoder.raw_decode(text, position)
+        except json.JSONDecodeError as error:
+            # An object cut off by the end of the buffer, read more unless there is nothing left
+            if end_of_file:
+                if text[position:].strip():
+                    raise
+                return
+            # Strings longer than a read legitimately fail at their start again, other errors move once the element is complete
+            if failed_at == consumed + error.pos and error.pos < len(text) - 1 and not error.msg.startswith("Unterminated string"):
+                raise ValueError(f"Malformed array element at character {consumed + position}: {error.msg}") from error
+            failed_at = consumed + error.pos
+            data = file.read(read_size)
+            end_of_file = not data
+            consumed += position
+            text = text[position:] + text_decoder.decode(data, final=end_of_file)
+            position = 0
+            continue
+        failed_at = None
+        yield record
+
+def iterate_archive(path: str, chunk_size: int = 2000) -> Iterator[Tuple[bool, List[Union[bytes, dict]]]]:
+    """Stream chunks of tweet records from a JSON or JSONL archive (optionally gzipped)
+
+    Args:
+        path (str): The path of the archive
+        chunk_size (int, optional): The number of records per chunk. Defaults to 2000.
+
+    Yields:
+        Tuple[bool, List[Union[bytes, dict]]]: Whether the chunk is raw JSONL lines (parsed by the workers) or already parsed objects, and the chunk
+    """
+    with _open_archive(path) as file:
+        head = file.peek(4096).lstrip()
+        if head[:1] == b"{":
+            chunk = []
+            for line in file:
+                chunk.append(line)
+                if len(chunk) == chunk_size:
+                    yield True, chunk
+                    chunk = []
+            if chunk:
+                yield True, chunk
+        else:
+            # A JSON array has to be parsed to find where its objects end, so it is parsed here
+            chunk = []
+            for record in _iterate_json_array(file):
+                chunk.append(record)
+                if len(chunk) == chunk_size:
+                    yield False, chunk
+                    chunk = []
+            if chunk:
+                yield False, chunk
+
+def ingest_archives(
+    database: mysql.connector.MySQLConnection,
+    paths: List[str],
+    workers: int = None,
+    batch_size: int = 1000,
+    deduplicator: Deduplicator = None,
+    logging: bool = True) -> Dict[str, float]:
+    """Load tweets from archive files into the tweets table
+
+    Args:
+        database (mysql.connector.MySQLConnection): The MySQL database connection to use
+        paths (List[str]): The JSON or JSONL archives (optionally gzipped), see iterate_archive
+        workers (int, optional): Number of processes parsing JSONL, defaults to the CPU count. Defaults to None.
+        batch_size (int, optional): The number of tweets per insert. Defaults to 1000.
+        deduplicator (Deduplicator, optional): Drops near-duplicate tweets if given. Defaults to None.
+        logging (bool, optional): Whether to log progress in stdout or not. Defaults to True.
+
+    Returns:
+        Dict[str, float]: Counts of the records read, tweets saved, retweets collapsed, records skipped (not a tweet or
+            no hashtags) and duplicates dropped, and the throughput in tweets/s and archive MB/s
+    """
+    workers = workers or os.cpu_count()
+    results = {
+        "files": len(paths),
+        "megabytes": sum(os.path.getsize(path) for path in paths) / 1e6,
+        "records": 0,
+        "saved": 0,
+        "retweets": 0,
+        "skipped": 0,
+        "duplicates": 0
+    }
+    cursor = database.cursor()
+    batch = []
+
+    def _insert():
+        cursor.executemany(
+            "INSERT INTO tweets (id, content, hashtags) VALUES (%s, %s, %s) ON DUPLICATE KEY UPDATE id=id",
+            batch
+        )
+        database.commit()
+        results["saved"] += len(batch)
+        batch.clear()
+        if logging: print(f"{results['saved']} tweets saved ({results['saved']/(time.perf_counter()-start):.0f} tweets/s)")
+
+    def _collect(future: Future, record_count: int):
+        tweets, retweets, skipped = future.result()
+        results["records"] += record_count
+        results["retweets"] += retweets
+        results["skipped"] += skipped
+        for tweet in tweets:
+            if deduplicator and deduplicator.is_duplicate(tweet[1]):
+                results["duplicates"] += 1
+                continue
+            batch.append(tweet)
+            if len(batch) >= batch_size:
+                _insert()
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Bounded so a large archive is never all in memory, results are used in file order
+        pending = deque()
+        for path in paths:
+            if logging: print(f"Reading {path}")
+            for raw, chunk in iterate_archive(path):
+                if raw:
+                    future = pool.submit(_parse_lines, chunk)
+                else:
+                    future = Future()
+                    future.set_result(_extract_records(chunk))
+                pending.append((future, len(chunk)))
+                while len(pending) > 2 * workers:
+                    _collect(*pending.popleft())
+        while pending:
+            _collect(*pending.popleft())
+    if batch:
+        _insert()
+    cursor.close()
+
+    results["seconds"] = time.perf_counter() - start
+    results["tweets_per_second"] = results["saved"] / results["seconds"] if results["seconds"] else 0
+    results["records_per_second"] = results["records"] / results["seconds"] if results["seconds"] else 0
+    results["megabytes_per_second"] = results["megabytes"] / results["seconds"] if results["seconds"] else 0
+    return results
@@ -1,4 +1,4 @@
-from typing import Any, List, Dict, Tuple
+from typing import Any, List, Dict, Tuple, Iterator, Union
 from nltk import pos_tag
 from nltk.corpus import wordnet as wn
 from nltk.tokenize import TweetTokenizer
@@ -91,6 +91,10 @@ def tokenize_tweet(tweet: str) -> List[str]:
 
     return simple_words, tags
 
+def warm_tokenizer():
+    """Load the NLTK models used by tokenize_tweet so the first real tweet isn't slowed down"""
+    tokenize_tweet("warming up the tokenizer")
+
 def tag_words(words: List[str], default=None) -> List[int]:
     """Tag words by part of speech
 
@@ -138,21 +142,41 @@ def filter_important_words(words: List[str], tags: List[int]) -> Tuple[Dict[str,
     
     return (filtered_words, filtered_tags)
 
-def load_tweets(database: mysql.connector.MySQLConnection) -> List[Tuple[str,str]]:
+def load_tweets(database: mysql.connector.MySQLConnection, with_ids: bool = False) -> Union[List[Tuple[str,str]], List[Tuple[int,str,str]]]:
     """Download tweets from a MySQL database
 
     Args:
         database (mysql.connector.MySQLConnection): The MySQL database connection to use
+        with_ids (bool, optional): Whether to include the tweet IDs, in which case tweets are (id, content, hashtags). Defaults to False.
 
     Returns:
-        List[Tuple[str,str]]: A list of tweets (content, hashtags)
+        Union[List[Tuple[str,str]], List[Tuple[int,str,str]]]: A list of tweets (content, hashtags), or (id, content, hashtags) with_ids
     """
     cursor = database.cursor()
-    cursor.execute("SELECT content, hashtags FROM tweets")
+    cursor.execute("SELECT id, content, hashtags FROM tweets" if with_ids else "SELECT content, hashtags FROM tweets")
     tweets = cursor.fetchall()
     cursor.close()
     return tweets
 
+def iterate_tweets(database: mysql.connector.MySQLConnection, batch_size: int = 10000) -> Iterator[Tuple[str,str]]:
+    """Stream tweets from a MySQL database in ID order without loading them all at once
+
+    Args:
+        database (mysql.connector.MySQLConnection): The MySQL database connection to use
+        batch_size (int, optional): Batch size for fetching tweets. Defaults to 10000.
+
+    Yields:
+        Tuple[str,str]: A tweet (content, hashtags)
+    """
+    cursor = database.cursor()
+    cursor.execute("SELECT content, hashtags FROM tweets ORDER BY id ASC")
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        yield from rows
+    cursor.close()
+
 def draw_progress_bar(percentage, width=20):
     sys.stdout.write("\r")
     sys.stdout.write("[{:<{}}] {:.0f}%".format("=" * int(width * percentage), width, percentage * 100))
@@ -172,4 +196,44 @@ def sort_probabilities(probabilities: numpy.ndarray) -> numpy.ndarray:
         probabilities
     )).T # Transpose is required to make it a horizontal stack instead of vertical stack
     sorted_probabilities = sorted_probabilities[sorted_probabilities[:,1].argsort()] # Sorts the new array by the second column (which contains the probability)
-    return sorted_probabilities[::-1]
\ No newline at end of file
+    return sorted_probabilities[::-1]
+
+def top_k(scores: numpy.ndarray, k: int) -> numpy.ndarray:
+    """Get the indices of the k highest scores
+
+    Args:
+        scores (numpy.ndarray): The scores (shape is (n,))
+        k (int): The number of indices to get
+
+    Returns:
+        numpy.ndarray: Up to k indices sorted by highest score
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return numpy.zeros(0, dtype=numpy.int64)
+    indices = numpy.argpartition(-scores, k - 1)[:k]
+    return indices[numpy.argsort(-scores[indices], kind="stable")]
+
+TWITTER_EPOCH = 1288834974657 # Milliseconds, the epoch used by Twitter's snowflake IDs
+
+def tweet_id_to_timestamp(tweet_id: int) -> float:
+    """Get the creation time of a tweet from its (snowflake) ID
+
+    Args:
+        tweet_id (int): The ID of the tweet
+
+    Returns:
+        float: The UNIX timestamp in seconds
+    """
+    return ((int(tweet_id) >> 22) + TWITTER_EPOCH) / 1000
+
+def timestamp_to_tweet_id(timestamp: float) -> int:
+    """Get the smallest (snowflake) tweet ID created at a point in time
+
+    Args:
+        timestamp (float): The UNIX timestamp in seconds
+
+    Returns:
+        int: The tweet ID
+    """
+    return max(int(timestamp * 1000) - TWITTER_EPOCH, 0) << 22
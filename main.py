@@ -1,41 +1,192 @@
 # Flask web app
 
 from flask import Flask, request, abort
-import json, mysql.connector, nltk
+import json, mysql.connector, nltk, threading, time, os
 import lib
 
 nltk.download("wordnet")
 nltk.download("averaged_perceptron_tagger")
 
-# Will change later so it's fine for it to be in repo
-database = mysql.connector.connect(
-    host="db",
-    user="TweetHashtagAssigner",
-    password="password",
-    database="TweetHashtagAssigner",
-    use_pure=True
-)
+def connect():
+    # Will change later so it's fine for it to be in repo
+    # Connections aren't thread-safe, every thread using the database opens its own
+    return mysql.connector.connect(
+        host="db",
+        user="TweetHashtagAssigner",
+        password="password",
+        database="TweetHashtagAssigner",
+        use_pure=True
+    )
+
 app = Flask(__name__)
-print("Loading model")
-model = lib.Model.load(database, 10, 1)
-print("Model loaded")
+
+# Comma separated host:port list of shard servers (see shard_server.py), the model is loaded in-process if not set
+SHARD_ADDRESSES = os.environ.get("SHARD_ADDRESSES")
+SHARD_AUTHKEY = os.environ.get("SHARD_AUTHKEY", "") # Required with SHARD_ADDRESSES, shard requests are unpickled
+SHARD_TIMEOUT = float(os.environ.get("SHARD_TIMEOUT", 5.0)) # Seconds to wait for a shard before answering 503
+TRENDING_OVERSAMPLE = 5 # Sharded top-k is fetched this many times larger so trending re-ranking has candidates
+QUANTIZE = os.environ.get("QUANTIZE") # "uint8" or "float16" to serve a quantized model (see compare_quantization.py)
+
+DEFAULT_MODEL_ID = int(os.environ.get("MODEL_ID", 1)) # Served when a request has no model parameter
+MODEL_MEMORY_BUDGET = int(os.environ.get("MODEL_MEMORY_BUDGET", 4096)) * 1024 * 1024 # MiB for all loaded models
+
+if SHARD_ADDRESSES:
+    if not SHARD_AUTHKEY:
+        raise SystemExit("SHARD_AUTHKEY must be set when SHARD_ADDRESSES is")
+    shard_client = lib.ShardClient(
+        [ (address.rsplit(":", 1)[0], int(address.rsplit(":", 1)[1])) for address in SHARD_ADDRESSES.split(",") ],
+        SHARD_AUTHKEY.encode(),
+        SHARD_TIMEOUT
+    )
+else:
+    shard_client = None
+
+def load_model(model_id):
+    database = connect()
+    try:
+        cursor = database.cursor()
+        cursor.execute("SELECT id FROM models WHERE id=%s", (model_id,))
+        exists = bool(cursor.fetchall())
+        cursor.close()
+        if not exists:
+            raise KeyError(model_id)
+        if shard_client:
+            # The shards hold the relations, only the vocabulary is needed to tokenize and name hashtags
+            model = lib.BaseModel.load(database, model_id)
+        else:
+            model = lib.Model.load(database, 10, model_id)
+            if QUANTIZE:
+                model = lib.QuantizedModel.from_model(model, QUANTIZE)
+        model.priors = lib.HashtagPriors.build(database, model)
+        model.hashtag_index = lib.HashtagIndex(model.hashtags, model.hashtag_frequencies)
+        return model
+    finally:
+        database.disconnect()
+
+models = lib.ModelRegistry(load_model, MODEL_MEMORY_BUDGET)
+models.get(DEFAULT_MODEL_ID)
+
+def get_model():
+    """Get the model of the request's model parameter, aborts with 404 if there is none"""
+    model_id = request.args.get("model", default=DEFAULT_MODEL_ID, type=int)
+    if shard_client and model_id != DEFAULT_MODEL_ID:
+        abort(404) # The shard servers only hold the default model
+    try:
+        return models.get(model_id)
+    except KeyError:
+        abort(404)
+
+PRIORS_REFRESH_INTERVAL = 60 # Seconds between counting newly downloaded tweets
+
+def refresh_priors():
+    # Counts new tweets in the background so no request waits for it, with a connection of its own
+    database = None
+    while True:
+        time.sleep(PRIORS_REFRESH_INTERVAL)
+        sessions.expire() # Idle sessions are dropped even without new traffic
+        try:
+            database = database or connect()
+            for model in models.models():
+                model.priors.refresh(database, model)
+        except mysql.connector.Error as error:
+            print(f"Refreshing priors failed: {error}")
+            database = None # Reconnect on the next refresh
+
+TRENDING_WEIGHT = float(os.environ.get("TRENDING_WEIGHT", 0)) # Default boost of trending hashtags, 0 so rankings only change when asked for with ?trending=
+DIVERSIFY_OVERSAMPLE = 3 # Candidates fetched per returned hashtag when near-synonyms are removed
+DIVERSIFY_THRESHOLD = 0.5 # Co-occurrence similarity from which two hashtags count as near-synonyms
+SESSION_MEMORY_BUDGET = int(os.environ.get("SESSION_MEMORY_BUDGET", 256)) * 1024 * 1024 # MiB for the running scores of as-you-type sessions
+
+sessions = lib.ScoringSessions(SESSION_MEMORY_BUDGET)
+threading.Thread(target=refresh_priors, daemon=True).start()
 
 @app.route('/api/probability')
 def main():
-    global model
     text = request.args.get("text", default=None)
     if text:
-        prob = model.text_probability(text)
-        prob = lib.sort_probabilities(prob)
-        hashtags = []
-        for x in range(min(10,len(prob))):
-            hashtags.append(model.get_hashtag_string(prob[x][0]))
+        model = get_model()
+        trending_weight = request.args.get("trending", default=TRENDING_WEIGHT, type=float)
+        diversify = request.args.get("diversify", default=0, type=int) and model.cooccurrence != None
+        candidate_count = 10 * DIVERSIFY_OVERSAMPLE if diversify else 10
+        if shard_client:
+            try:
+                results = shard_client.top_k(model.get_text_word_ids(text), candidate_count * TRENDING_OVERSAMPLE if trending_weight else candidate_count)
+            except (TimeoutError, ConnectionError) as error:
+                print(error)
+                abort(503)
+            if trending_weight:
+                prior = model.priors.prior()
+                results.sort(key=lambda result: -result[1] * (1 + trending_weight * prior[result[0]] * len(prior)))
+            hashtag_ids = [ hashtag_id for hashtag_id, _ in results[:candidate_count] ]
+        else:
+            prob = model.text_probability(text, trending_weight=trending_weight)
+            prob = lib.sort_probabilities(prob)
+            hashtag_ids = [ hashtag_id for hashtag_id, _ in prob[:candidate_count] ]
+        if diversify:
+            hashtag_ids = model.cooccurrence.diversify(hashtag_ids, 10, DIVERSIFY_THRESHOLD)
+        hashtags = [ model.get_hashtag_string(hashtag_id) for hashtag_id in hashtag_ids[:10] ]
         return json.dumps({
             "hashtags": hashtags
         })
     else:
         abort(404) 
 
+@app.route('/api/session')
+def session():
+    # As-you-type suggestions, only the words that changed since the session's last text are scored
+    session_id = request.args.get("id", default=None)
+    if session_id and not shard_client: # The shard servers don't keep session scores
+        text = request.args.get("text", default="")
+        model = get_model()
+        trending_weight = request.args.get("trending", default=TRENDING_WEIGHT, type=float)
+        diversify = request.args.get("diversify", default=0, type=int) and model.cooccurrence != None
+        word_ids = model.get_text_word_ids(text)
+        prob = model.trending_boost(sessions.update(session_id, model, word_ids), trending_weight)
+        hashtag_ids = lib.top_k(prob, 10 * DIVERSIFY_OVERSAMPLE if diversify else 10).tolist() if word_ids else []
+        if diversify:
+            hashtag_ids = model.cooccurrence.diversify(hashtag_ids, 10, DIVERSIFY_THRESHOLD)
+        return json.dumps({
+            "hashtags": [ model.get_hashtag_string(hashtag_id) for hashtag_id in hashtag_ids ]
+        })
+    else:
+        abort(404)
+
+@app.route('/api/hashtags')
+def hashtags():
+    prefix = request.args.get("prefix", default=None)
+    if prefix != None:
+        model = get_model()
+        limit = request.args.get("limit", default=model.hashtag_index.top_count, type=int)
+        return json.dumps({
+            "hashtags": [ model.get_hashtag_string(hashtag_id) for hashtag_id in model.hashtag_index.complete(prefix, limit) ]
+        })
+    else:
+        abort(404)
+
+@app.route('/api/related')
+def related():
+    hashtag = request.args.get("hashtag", default=None)
+    model = get_model() if hashtag else None
+    if model and model.cooccurrence != None:
+        try:
+            hashtag_id = model.get_hashtag_id(hashtag.lstrip("#"))
+        except KeyError:
+            abort(404)
+        limit = request.args.get("limit", default=10, type=int)
+        return json.dumps({
+            "hashtags": [ model.get_hashtag_string(related_id) for related_id in model.cooccurrence.related(hashtag_id, limit) ]
+        })
+    else:
+        abort(404)
+
+@app.route('/api/models')
+def loaded_models():
+    return json.dumps({
+        "memory_budget": models.memory_budget,
+        "nbytes": models.nbytes,
+        "models": models.stats()
+    })
+
 if __name__ == "__main__":
     # Only for debugging, this code will not run on server
     app.run(debug=True, port=80)
\ No newline at end of file
@@ -0,0 +1,51 @@
+# Builds a quick preview model from a stratified sample of the tweets table and reports how close it is to a full model
+
+import argparse, time
+import mysql.connector
+import lib
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--address","-a",help="Hostname of the database",default="db")
+parser.add_argument("--database","-d",help="Name of database to use",default="TweetHashtagAssigner")
+parser.add_argument("--user","-u",help="Database user to login with",default="TweetHashtagAssigner")
+parser.add_argument("--password","-p",help="Database password for user",required=True)
+parser.add_argument("--sample_size","-n",help="Number of tweets in the uniform part of the sample",type=int,default=100000)
+parser.add_argument("--per_hashtag","-ph",help="Number of tweets kept for every hashtag so rare hashtags are represented",type=int,default=3)
+parser.add_argument("--max_size","-ms",help="Largest number of sampled tweets, hashtag tweets over it are dropped (defaults to twice the sample size)",type=int,default=None)
+parser.add_argument("--probe_size","-ps",help="Number of probe tweets for comparing with the full model",type=int,default=1000)
+parser.add_argument("--seed","-s",help="Seed of the sample",type=int,default=0)
+parser.add_argument("--full_model_id","-f",help="Saved full model to compare the preview with (no comparison if not given)",type=int,default=None)
+parser.add_argument("--top","-k",help="Number of top hashtags compared",type=int,default=10)
+parser.add_argument("--model_id","-m",help="Model ID to save the preview to (not saved if not given)",type=int,default=None)
+parser.add_argument("--logging","-l",help="Log actions",action="store_true")
+args = parser.parse_args()
+
+if __name__ == "__main__":
+    database = mysql.connector.connect(
+        host=args.address,
+        user=args.user,
+        password=args.password,
+        database=args.database
+    )
+
+    timings = {}
+    start = time.perf_counter()
+    reservoir = lib.StratifiedReservoir(args.sample_size, args.per_hashtag, args.probe_size, args.seed, args.max_size)
+    reservoir.extend(lib.iterate_tweets(database))
+    timings["sample_seconds"] = time.perf_counter() - start
+    if args.logging: print(f"{reservoir.seen} tweets read, {len(reservoir.sample)} sampled")
+
+    start = time.perf_counter()
+    preview = lib.Model.build(reservoir.sample, logging=args.logging)
+    timings["build_seconds"] = time.perf_counter() - start
+
+    results = reservoir.stats()
+    if args.full_model_id != None:
+        full = lib.Model.load(database, 10, args.full_model_id)
+        results.update(lib.compare_preview(full, preview, [ tweet[0] for tweet in reservoir.probes ], args.top))
+    if args.model_id != None:
+        preview.save(database, 10, args.model_id)
+    database.disconnect()
+
+    for name, value in { **timings, **results }.items():
+        print(f"{name}:",value)
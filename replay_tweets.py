@@ -0,0 +1,48 @@
+# Loads tweets from archived JSON/JSONL dumps (optionally gzipped) into the tweets table, for backfills and load tests
+
+import argparse, time
+import mysql.connector
+from lib.Deduplicator import Deduplicator
+from lib.ingest import ingest_archives
+
+parser = argparse.ArgumentParser()
+parser.add_argument("paths",help="Archive files (one tweet JSON per line, or a JSON array)",nargs="+")
+parser.add_argument("--address","-a",help="Hostname of output database",default="db")
+parser.add_argument("--database","-d",help="Name of database to use",default="TweetHashtagAssigner")
+parser.add_argument("--user","-u",help="Database user to login with",default="TweetHashtagAssigner")
+parser.add_argument("--password","-p",help="Database password for user",required=True)
+parser.add_argument("--workers","-w",help="Number of parsing processes (defaults to the CPU count)",type=int,default=None)
+parser.add_argument("--batch_size","-b",help="Number of tweets per insert",type=int,default=1000)
+parser.add_argument("--dedup_threshold","-dt",help="Estimated similarity above which a tweet is dropped as a near-duplicate (0 disables deduplication)",type=float,default=0.8)
+parser.add_argument("--dedup_window","-dw",help="Number of recent tweets remembered for deduplication",type=int,default=100000)
+parser.add_argument("--logging","-l",help="Log actions",action="store_true")
+args = parser.parse_args()
+
+if __name__ == "__main__":
+    database = mysql.connector.connect(
+        host=args.address,
+        user=args.user,
+        password=args.password,
+        database=args.database
+    )
+
+    deduplicator = Deduplicator(threshold=args.dedup_threshold, window=args.dedup_window) if args.dedup_threshold > 0 else None
+    results = ingest_archives(
+        database,
+        args.paths,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        deduplicator=deduplicator,
+        logging=args.logging
+    )
+    database.disconnect()
+
+    print("Records read:",results["records"])
+    print("Tweets saved:",results["saved"])
+    print("Retweets collapsed:",results["retweets"])
+    print("Records skipped (not a tweet or no hashtags):",results["skipped"])
+    print("Near-duplicates dropped:",results["duplicates"])
+    print("Total time (s):",results["seconds"])
+    print("Tweets per second:",results["tweets_per_second"])
+    print("Records per second:",results["records_per_second"])
+    print("Archive MB per second:",results["megabytes_per_second"])
@@ -0,0 +1,54 @@
+# Serves a hashtag range of a model for the sharded web app (see SHARD_ADDRESSES in main.py)
+# Run with --shard on each node, or without it to start every shard as a local process
+
+import argparse, multiprocessing
+import mysql.connector
+import lib
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--address","-a",help="Hostname of the database",default="db")
+parser.add_argument("--database","-d",help="Name of database to use",default="TweetHashtagAssigner")
+parser.add_argument("--user","-u",help="Database user to login with",default="TweetHashtagAssigner")
+parser.add_argument("--password","-p",help="Database password for user",required=True)
+parser.add_argument("--model_id","-m",help="ID of the model to serve",type=int,default=1)
+parser.add_argument("--shards","-n",help="Total number of shards",type=int,required=True)
+parser.add_argument("--shard","-s",help="Index of the shard to serve, all shards are started locally if not given",type=int,default=None)
+parser.add_argument("--host",help="Host to listen on (use 0.0.0.0 to serve other machines, only on a trusted network)",default="127.0.0.1")
+parser.add_argument("--port",help="Port of the first shard, shard i listens on port + i when started locally",type=int,default=13000)
+parser.add_argument("--authkey","-k",help="Shared key for the web app to connect with",required=True)
+args = parser.parse_args()
+
+def serve(shard: int, port: int):
+    database = mysql.connector.connect(
+        host=args.address,
+        user=args.user,
+        password=args.password,
+        database=args.database,
+        use_pure=True
+    )
+    cursor = database.cursor()
+    cursor.execute(f"SELECT COUNT(*) FROM hashtags_{args.model_id}")
+    hashtag_count = cursor.fetchall()[0][0]
+    cursor.execute(f"SELECT COUNT(*) FROM words_{args.model_id}")
+    word_count = cursor.fetchall()[0][0]
+    cursor.close()
+
+    hashtag_range = lib.shard_range(hashtag_count, shard, args.shards)
+    relations, large_counts = lib.Model.load_relations(database, 10, args.model_id, word_count, hashtag_range)
+    database.disconnect()
+
+    print(f"Shard {shard} serving hashtags {hashtag_range[0]} to {hashtag_range[1]-1} on port {port}")
+    lib.ShardServer(relations, hashtag_range[0], (args.host, port), args.authkey.encode(), large_counts).serve_forever()
+
+if __name__ == "__main__":
+    if args.shard != None:
+        serve(args.shard, args.port)
+    else:
+        processes = [
+            multiprocessing.Process(target=serve, args=(shard, args.port + shard))
+            for shard in range(args.shards)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
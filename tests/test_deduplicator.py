@@ -0,0 +1,31 @@
+import unittest
+import numpy
+
+from lib.Deduplicator import Deduplicator
+
+class DeduplicatorTest(unittest.TestCase):
+    def _check(self, deduplicator: Deduplicator, signature) -> bool:
+        signature = numpy.array(signature, dtype=numpy.uint32)
+        keys = deduplicator._keys(signature)
+        probes = []
+        if deduplicator._find_duplicate(signature, keys, probes):
+            return True
+        deduplicator._insert(signature, keys, probes)
+        return False
+
+    def test_match_in_later_band_behind_collected_entry(self):
+        # The newer entry is collected from the first band and heads the last band's chain,
+        # the older one behind it only shares the last band with the new tweet
+        deduplicator = Deduplicator(threshold=0.6, permutations=8, bands=4, window=16)
+        self.assertFalse(self._check(deduplicator, [10,0, 20,0, 30,0, 40,41]))
+        self.assertFalse(self._check(deduplicator, [10,11, 1,1, 2,2, 40,41]))
+        self.assertTrue(self._check(deduplicator, [10,11, 20,21, 30,31, 40,41]))
+
+    def test_near_duplicate_text(self):
+        deduplicator = Deduplicator(threshold=0.5)
+        self.assertFalse(deduplicator.is_duplicate("the quick brown fox jumps over the lazy dog today"))
+        self.assertTrue(deduplicator.is_duplicate("RT @someone: the quick brown fox jumps over the lazy dog today https://t.co/x"))
+        self.assertFalse(deduplicator.is_duplicate("an entirely different tweet about something else"))
+
+if __name__ == "__main__":
+    unittest.main()
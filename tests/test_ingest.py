@@ -0,0 +1,50 @@
+import gzip, json, os, tempfile, unittest
+
+from lib.ingest import extract_tweet, iterate_archive, _extract_records
+
+def _tweet(tweet_id, text, hashtags):
+    return {
+        "id": tweet_id,
+        "full_text": text,
+        "entities": { "hashtags": [ { "text": hashtag } for hashtag in hashtags ] }
+    }
+
+class TwitterArchiveTest(unittest.TestCase):
+    def _write(self, content: bytes, gzipped: bool = False) -> str:
+        file = tempfile.NamedTemporaryFile(suffix=".js", delete=False)
+        file.write(gzip.compress(content) if gzipped else content)
+        file.close()
+        self.addCleanup(os.remove, file.name)
+        return file.name
+
+    def _records(self, path: str, chunk_size: int = 2000):
+        records = []
+        for raw, chunk in iterate_archive(path, chunk_size):
+            self.assertFalse(raw)
+            records.extend(chunk)
+        return records
+
+    def test_extract_archive_record(self):
+        self.assertEqual(
+            extract_tweet({ "tweet": _tweet(1, "hello #world", ["world"]) }),
+            (1, "hello #world", ["world"], False)
+        )
+
+    def test_ingest_archive_file(self):
+        records = [ { "tweet": _tweet(index, f"tweet {index} #tag{index % 3}", [f"tag{index % 3}"]) } for index in range(50) ]
+        records.append({ "tweet": _tweet(50, "no hashtags", []) })
+        for gzipped in (False, True):
+            path = self._write(b"window.YTD.tweet.part0 = " + json.dumps(records, indent=2).encode(), gzipped)
+            tweets, retweets, skipped = _extract_records(self._records(path, chunk_size=7))
+            self.assertEqual(tweets, [ (index, f"tweet {index} #tag{index % 3}", f"tag{index % 3}") for index in range(50) ])
+            self.assertEqual((retweets, skipped), (0, 1))
+
+    def test_malformed_element_fails(self):
+        content = b"window.YTD.tweet.part0 = [" + b"{\"tweet\": {\"id\": 1,}}," + b", ".join(
+            json.dumps({ "tweet": _tweet(index, "x #y", ["y"]) }).encode() for index in range(20000)
+        ) + b"]"
+        with self.assertRaisesRegex(ValueError, "Malformed array element"):
+            self._records(self._write(content))
+
+if __name__ == "__main__":
+    unittest.main()
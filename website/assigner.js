@@ -10,4 +10,50 @@ function getHashtags(){
             children[index].innerHTML = hashtags[index];
         }
     })
-}
\ No newline at end of file
+}
+
+// As-you-type suggestions, the server keeps the scores of this session's last text so only edits are scored
+let sessionId = Math.random().toString(36).slice(2) + Date.now().toString(36)
+let suggestionPending = false
+let suggestionQueued = false
+
+function suggestHashtags(){
+    // At most one request at a time, edits made while waiting are sent together once it returns
+    if (suggestionPending) {
+        suggestionQueued = true
+        return
+    }
+    suggestionPending = true
+    let text = document.getElementById("tweet").value
+    fetch(`/api/session?id=${sessionId}&text=${encodeURIComponent(text)}`).then(function (response) {
+        return response.json()
+    }).then(function (data) {
+        let hashtags = data["hashtags"]
+        let children = document.getElementById("hashtags").children
+
+        for (let index=0; index < children.length; index++) {
+            children[index].innerHTML = index < hashtags.length ? hashtags[index] : ""
+        }
+    }).finally(function () {
+        suggestionPending = false
+        if (suggestionQueued) {
+            suggestionQueued = false
+            suggestHashtags()
+        }
+    })
+}
+
+function completeHashtag(){
+    let prefix = document.getElementById("hashtagPrefix").value
+    fetch(`/api/hashtags?prefix=${encodeURIComponent(prefix)}`).then(function (response) {
+        return response.json()
+    }).then(function (data) {
+        let completions = document.getElementById("hashtagCompletions")
+        completions.innerHTML = ""
+        for (let hashtag of data["hashtags"]) {
+            let option = document.createElement("option")
+            option.value = hashtag
+            completions.appendChild(option)
+        }
+    })
+}